@@ -18,14 +18,14 @@
 import os
 import os.path
 from logging import info, debug, warn, error
-from sqlite3 import dbapi2 as sqlite
-import numpy
 import scipy.stats
 import sys
 
 # tcp-eval imports
 from common.functions import call
 from analysis.analysis import Analysis
+from analysis.flowgrinddb import FlowgrindDatabase
+from analysis.aggregates import aggregateOverX
 from visualization.gnuplot import UmGnuplot, UmLinePointPlot
 
 class ReorderingAnalysis(Analysis):
@@ -90,89 +90,6 @@ class ReorderingAnalysis(Analysis):
             sys.exit(1)
 
 
-    def onLoad(self, record, iterationNo, scenarioNo, runNo, test):
-        dbcur = self.dbcon.cursor()
-
-        #try:
-        if True:
-            recordHeader   = record.getHeader()
-            src            = recordHeader["src"]
-            dst            = recordHeader["dst"]
-            run_label      = recordHeader["run_label"]
-            scenario_label = recordHeader["scenario_label"]
-            variable       = recordHeader["testbed_param_variable"]
-            reordering     = recordHeader["testbed_param_reordering"]
-            qlimit         = int(recordHeader["testbed_param_qlimit"])
-            rrate          = int(recordHeader["testbed_param_rrate"])
-            rdelay         = int(recordHeader["testbed_param_rdelay"])
-        #except:
-        #    return
-
-	null = None
-        try:
-            bnbw       = int(recordHeader["testbed_param_bottleneckbw"])
-        except KeyError:
-            bnbw       = null
-
-        try:
-            delay      = int(recordHeader["testbed_param_delay"])
-        except KeyError:
-            delay      = null
-
-        try:
-            ackreor    = int(recordHeader["testbed_param_ackreor"])
-        except KeyError:
-            ackreor    = null
-
-        try:
-            ackloss    = int(recordHeader["testbed_param_ackloss"])
-        except KeyError:
-            ackloss    = null
-
-        # test_start_time was introduced later in the header, so its not in old test logs
-        try:
-            start_time = int(float(recordHeader["test_start_time"]))
-        except KeyError:
-            start_time = 0
-        thruput        = record.calculate("thruput")
-        rtos           = record.calculate("total_rto_retransmits")
-        frs            = record.calculate("total_fast_retransmits")
-
-        if not thruput:
-            if not self.failed.has_key(run_label):
-                self.failed[run_label] = 1
-            else:
-                self.failed[run_label] = self.failed[run_label]+1
-            return
-        if thruput == 0:
-            warn("Throughput is 0 in %s!" %record.filename)
-
-        try:
-            rtos = int(rtos)
-        except TypeError, inst:
-            rtos = null
-
-        try:
-            frs = int(frs)
-        except TypeError, inst:
-            frs = null
-
-        # check for lost SYN or long connection establishing
-        #c = 0
-        #flow_S = record.calculate("flows")[0]['S']
-        #for tput in flow_S['tput']:
-        #    if tput == 0.000000:
-        #        c += 1
-        #    else: break
-        #if flow_S['end'][c] > 1:
-        #    warn("Long connection establishment (%ss): %s" %(flow_S['end'][c], record.filename))
-
-        dbcur.execute("""
-                      INSERT INTO tests VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                      """,  (variable, reordering, bnbw, qlimit, delay, rrate, rdelay, ackreor, ackloss, rtos, frs, iterationNo, scenarioNo, runNo, src, dst, thruput,
-                             start_time, "$"+run_label+"$", scenario_label, test))
-                      #INSERT INTO tests VALUES ("%s", "%s", %s, %u, %u, %u, %u, %u, %u, %s, %s, %u, %u, %u, "%s", "%s", %f, %u, "$%s$", "%s", "%s")
-
     def generateFairnessOverXLinePlot(self):
         """Generates a line plot of the DB column y over the DB column x
            reordering rate. One line for each scenario.
@@ -199,19 +116,27 @@ class ReorderingAnalysis(Analysis):
         p.setYLabel(self.plotlabels[y])
 
         for scenarioNo in scenarios:
+            # Jain's fairness index of the average thruput of the flows,
+            # one flow per scenario label
             query = '''
-                SELECT bnbw,avg(thruput),scenario_label
-                FROM tests
-                WHERE scenarioNo=%s
-                GROUP BY scenario_label, bnbw
+                SELECT bnbw, jain(avg_thruput)
+                FROM
+                (
+                    SELECT bnbw, scenario_label, avg(thruput) AS avg_thruput
+                    FROM tests
+                    WHERE scenarioNo=?
+                    GROUP BY scenario_label, bnbw
+                )
+                GROUP BY bnbw
                 ORDER BY bnbw;
-            ''' %scenarioNo
+            '''
             debug("\n\n" + query + "\n\n")
-            fairness = dbcur.execute(query).fetchall()
+            fairness = dbcur.execute(query, (scenarioNo,)).fetchall()
+            labels = [row[0] for row in dbcur.execute('''
+                SELECT DISTINCT scenario_label FROM tests WHERE scenarioNo=?
+                ORDER BY scenario_label''', (scenarioNo,))]
 
             # fairness plot
-            k = 0
-            j = 1
             plotname = "%s_%s_over_%s_s%u" % (rotype, y, x, scenarioNo)
             valfilename = os.path.join(outdir, plotname+".values")
 
@@ -221,20 +146,13 @@ class ReorderingAnalysis(Analysis):
             # header
             fhv.write("# %s %s\n" % (x, y))
 
-            # Jain's fairness index
-            for i in range(0, len(fairness), 2):
-                try:
-                    zaehler = (fairness[i][1] + fairness[i+1][1])**2
-                    nenner = 2 * (fairness[i][1]**2 + fairness[i+1][1]**2)
-                    jain_index = float(zaehler)/float(nenner)
-                except: jain_index = 0
-
-                fhv.write("%s %s\n" %(fairness[i][0], jain_index))
+            for (bnbw, jain_index) in fairness:
+                fhv.write("%s %s\n" %(bnbw, jain_index or 0))
 
             fhv.close()
 
             info("start plot")
-            p.plot(valfilename, "%s - %s" %(fairness[0][2], fairness[1][2]), linestyle=scenarioNo, using="1:2")
+            p.plot(valfilename, " - ".join(labels), linestyle=scenarioNo, using="1:2")
             info("end plot")
 
         # make room for the legend
@@ -266,28 +184,19 @@ class ReorderingAnalysis(Analysis):
         p.setXLabel(self.plotlabels[x])
         p.setYLabel(self.plotlabels[y])
 
+        # 1) aggregate the iterations of each run of one scenario under one testbed
+        #    configuration by avg() to get the average total y of such flows
+        # 2) sum() up these average values of each scenario under one testbed
+        #    configuration to get the total average y of one scenario under one
+        #    testbed configuration
+        # all scenarios and x values at once, with the statistics over the
+        # iterations for the error bars
+        cells = aggregateOverX(self.dbcon, y, x,
+                               where = "variable=? AND reordering=?",
+                               params = (x, rotype))
+
         max_y_value = 0
         for scenarioNo in scenarios.keys():
-            # 1) aggregate the iterations of each run of one scenario under one testbed
-            #    configuration by avg() to get the average total y of such flows
-            # 2) sum() up these average values of each scenario under one testbed
-            #    configuration to get the total average y of one scenario under one
-            #    testbed configuration
-            query = '''
-                SELECT %s, sum(avg_y) AS total_avg_y
-                FROM
-                (
-                    SELECT %s, runNo, avg(%s) AS avg_y
-                    FROM tests
-                    WHERE scenarioNo=%u AND variable='%s' AND reordering='%s'
-                    GROUP BY %s, runNo
-                )
-                GROUP BY %s
-                ORDER BY %s
-            ''' % (x, x, y, scenarioNo, x, rotype, x, x, x)
-            debug("\n\n" + query + "\n\n")
-            dbcur.execute(query)
-
             plotname = "%s_%s_over_%s_s%u" % (rotype, y, x, scenarioNo)
             valfilename = os.path.join(outdir, plotname+".values")
 
@@ -295,16 +204,19 @@ class ReorderingAnalysis(Analysis):
             fhv = file(valfilename, "w")
 
             # header
-            fhv.write("# %s %s\n" % (x, y))
+            if self.args.plot_error:
+                fhv.write("# %s %s stddev count lower upper\n" % (x, y))
+            else:
+                fhv.write("# %s %s\n" % (x, y))
 
             # data
             success = False
-            for row in dbcur:
-                (x_value, y_value) = row
+            for row in cells.get((scenarioNo,), []):
+                (x_value, y_value, mean, stddev, count, lower, upper) = row
                 try:
                     if self.args.plot_error:
-                        stddev = self.calculateStdDev(y, x_value, scenarioNo)
-                        fhv.write("%u %f %f\n" %(x_value, y_value, stddev))
+                        fhv.write("%u %f %f %u %f %f\n" %(x_value, y_value,
+                                  stddev, count, lower, upper))
                     else:
                         fhv.write("%u %f\n" %(x_value, y_value))
                 except TypeError:
@@ -329,66 +241,50 @@ class ReorderingAnalysis(Analysis):
 
         p.save()
 
-    def calculateStdDev(self, y, x_value, scenarioNo):
-        """Calculates the standarddeviation for the values of the YoverXPlot
-        """
-
-        x      = self.args.variable
-        rotype = self.args.rotype
-        dbcur = self.dbcon.cursor()
-
-        query = '''
-            SELECT sum(%s) AS sum_y
-            FROM tests
-            WHERE %s=%u AND scenarioNo=%u AND variable='%s' AND reordering='%s'
-            GROUP BY iterationNo
-        ''' % (y, x, x_value, scenarioNo, x, rotype)
-
-        dbcur.execute(query)
-        ary = numpy.array(dbcur.fetchall())
-        return ary.std()
-
     def run(self):
         """Main Method"""
 
-        # bring up database
-        dbexists = False
-        if os.path.exists('data.sqlite'):
-            dbexists = True
-        self.dbcon = sqlite.connect('data.sqlite')
-
-        if not dbexists:
-            dbcur = self.dbcon.cursor()
-            dbcur.execute("""
-            CREATE TABLE tests (variable    VARCHAR(15),
-                                reordering  VARCHAR(15),
-                                bnbw        INTEGER,
-                                qlimit      INTEGER,
-                                delay       INTEGER,
-                                rrate       INTEGER,
-                                rdelay      INTEGER,
-                                ackreor     INTEGER,
-                                ackloss     INTEGER,
-                                rtos        INTEGER,
-                                frs         INTEGER,
-                                iterationNo INTEGER,
-                                scenarioNo  INTEGER,
-                                runNo       INTEGER,
-                                src         INTEGER,
-                                dst         INTEGER,
-                                thruput     DOUBLE,
-                                start_time  INTEGER,
-                                run_label   VARCHAR(70),
-                                scenario_label VARCHAR(70),
-                                test        VARCHAR(50))
-            """)
-            # store failed test as a mapping from run_label to number
-            self.failed = dict()
-            # only load flowgrind test records
-            self.loadRecords(tests=["flowgrind"])
-            self.dbcon.commit()
-        else:
-            info("Database already exists, don't load records.")
+        # bring up the flowgrind database, only new or changed logs are
+        # loaded into it
+        db = FlowgrindDatabase(self)
+        db.ingest()
+        db.requireColumns("src", "dst", "run_label", "scenario_label",
+                          "testbed_param_variable", "testbed_param_reordering",
+                          "testbed_param_qlimit", "testbed_param_rrate",
+                          "testbed_param_rdelay", "testbed_param_bottleneckbw",
+                          "testbed_param_delay", "testbed_param_ackreor",
+                          "testbed_param_ackloss", "test_start_time")
+        self.dbcon = db.dbcon
+
+        # the tests of the plots are the flowgrind tests with all headers
+        # of the measurements and a throughput
+        self.dbcon.execute("""
+        CREATE TEMP VIEW tests AS
+        SELECT testbed_param_variable     AS variable,
+               testbed_param_reordering   AS reordering,
+               testbed_param_bottleneckbw AS bnbw,
+               testbed_param_qlimit       AS qlimit,
+               testbed_param_delay        AS delay,
+               testbed_param_rrate        AS rrate,
+               testbed_param_rdelay       AS rdelay,
+               testbed_param_ackreor      AS ackreor,
+               testbed_param_ackloss      AS ackloss,
+               total_rto_retransmits      AS rtos,
+               total_fast_retransmits     AS frs,
+               iterationNo, scenarioNo, runNo, src, dst, thruput,
+               coalesce(CAST(test_start_time AS INTEGER), 0) AS start_time,
+               '$' || run_label || '$'    AS run_label,
+               scenario_label, test
+        FROM records
+        WHERE test = 'flowgrind' AND thruput
+          AND src IS NOT NULL AND dst IS NOT NULL
+          AND run_label IS NOT NULL AND scenario_label IS NOT NULL
+          AND testbed_param_variable IS NOT NULL
+          AND testbed_param_reordering IS NOT NULL
+          AND testbed_param_qlimit IS NOT NULL
+          AND testbed_param_rrate IS NOT NULL
+          AND testbed_param_rdelay IS NOT NULL
+        """)
 
         if self.args.dry_run:
             return
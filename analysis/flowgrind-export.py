@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vi:et:sw=4 ts=4
+
+# Copyright (C) 2013 Alexander Zimmermann <alexander.zimmermann@netapp.com>
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms and conditions of the GNU General Public License,
+# version 2, as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for
+# more details.
+
+# python imports
+import os.path
+from logging import info, debug, warn, error
+
+# tcp-eval imports
+from analysis.analysis import Analysis
+from analysis.testrecords_flowgrind import FlowgrindRecordFactory
+from analysis.intervalarchive import IntervalArchiveWriter
+
+class IntervalExport(Analysis):
+    """Exports the interval rows of all flowgrind logs of a sweep into a
+       columnar archive, see IntervalArchive for reading it."""
+
+    def __init__(self):
+        Analysis.__init__(self)
+
+        self.parser.add_argument("-A", "--archive", metavar = "DIR",
+                        default = "intervals", action = "store", dest = "archive",
+                        help = "archive directory, relative to the output "\
+                               "directory [default: %(default)s]")
+
+    def onLoad(self, record, iterationNo, scenarioNo, runNo, test):
+        self.writer.addRecord(record, iterationNo, scenarioNo, runNo)
+
+    def run(self):
+        """Main Method"""
+
+        directory = os.path.join(self.args.outdir, self.args.archive)
+        self.writer = IntervalArchiveWriter(directory, FlowgrindRecordFactory().keys)
+        self.loadRecords(tests = ["flowgrind", "multiflowgrind"],
+                         whats = ["flows", "flow_ids"])
+        self.writer.close()
+
+    def main(self):
+        """Main method of the interval export object"""
+
+        self.parse_options()
+        self.apply_options()
+        self.run()
+
+# this only runs if the module was *not* imported
+if __name__ == '__main__':
+    IntervalExport().main()
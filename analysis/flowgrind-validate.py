@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vi:et:sw=4 ts=4
+
+# Copyright (C) 2013 Alexander Zimmermann <alexander.zimmermann@netapp.com>
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms and conditions of the GNU General Public License,
+# version 2, as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for
+# more details.
+
+# python imports
+import os.path
+import sys
+import json
+import itertools
+import multiprocessing
+from logging import info, debug, warn, error
+
+# tcp-eval imports
+from common.manifest import readManifest
+from analysis.analysis import Analysis
+from analysis.testrecord import COMPRESSIONS
+from analysis.logvalidator import CHECKS, validateLog
+
+def _validateLog(job):
+    """Validates a log in a worker process."""
+
+    (filename, setup) = job
+    return validateLog(filename, setup)
+
+class LogValidation(Analysis):
+    """Checks the flowgrind logs of a sweep in parallel without loading them
+       and writes a report with one JSON object per log, see validateLog()
+       for the checks. Exits with status 1 if a log has problems."""
+
+    def __init__(self):
+        Analysis.__init__(self)
+
+        # logs missing in the manifest are found, too
+        self.parser.set_defaults(jobs = multiprocessing.cpu_count(), walk = True)
+        self.parser.add_argument("-o", "--report", metavar = "FILE",
+                        default = "validation.json", action = "store", dest = "report",
+                        help = "report file, relative to the output directory, "\
+                               "'-' for stdout [default: %(default)s]")
+        self.parser.add_argument("--setup", metavar = "SEC", type = float,
+                        default = 1.0, action = "store", dest = "setup",
+                        help = "report connection setups taking longer "\
+                               "[default: %(default)s]")
+
+    def writeReport(self, fh, found, reports, status):
+        """Writes the reports of the logs found and returns the number of
+           logs with problems per check."""
+
+        counts = dict()
+        for (job, report) in itertools.izip(found, reports):
+            (iterationNo, scenarioNo, runNo, test, entry) = job
+
+            # the manifest knows tests which failed
+            for (suffix, signature, decompress) in COMPRESSIONS:
+                if entry.endswith(suffix):
+                    entry = entry[:-len(suffix)]
+            rc = status.get(entry)
+            if rc:
+                report["problems"].insert(0, dict(check = "failed", flow = None,
+                                                  detail = "exit status %s" % rc))
+
+            for check in set([problem["check"] for problem in report["problems"]]):
+                counts[check] = counts.get(check, 0) + 1
+            for problem in report["problems"]:
+                debug("%s: %s: %s" %(job[4], problem["check"], problem["detail"]))
+
+            report.update(path = job[4], iteration = iterationNo,
+                          scenario = scenarioNo, run = runNo, test = test,
+                          ok = not report["problems"])
+            fh.write(json.dumps(report, sort_keys = True) + "\n")
+
+        return counts
+
+    def run(self):
+        """Main Method"""
+
+        found = self.findRecords(["flowgrind", "multiflowgrind"])
+        if not found:
+            warn('Found no log records in "%s" Stop.' %self.args.indir)
+            sys.exit(0)
+
+        status = dict()
+        for entry in readManifest(self.args.indir) or []:
+            status[os.path.join(self.args.indir, entry["path"])] = entry.get("rc")
+
+        if self.args.report == "-":
+            fh = sys.stdout
+        else:
+            fh = open(os.path.join(self.args.outdir, self.args.report), "w")
+
+        jobs = [(job[4], self.args.setup) for job in found]
+        workers = min(self.args.jobs, len(jobs))
+        info("Validating %d test records in %d processes..." %(len(jobs), workers))
+        try:
+            if workers > 1:
+                pool = multiprocessing.Pool(workers)
+                try:
+                    chunksize = max(1, min(64, len(jobs) // (4 * workers)))
+                    reports = pool.imap(_validateLog, jobs, chunksize)
+                    counts = self.writeReport(fh, found, reports, status)
+                    pool.close()
+                finally:
+                    pool.terminate()
+                    pool.join()
+            else:
+                reports = itertools.imap(_validateLog, jobs)
+                counts = self.writeReport(fh, found, reports, status)
+        finally:
+            if fh is not sys.stdout:
+                fh.close()
+
+        if not counts:
+            info("All %d test records are valid." % len(found))
+            return
+        for check in CHECKS:
+            if check in counts:
+                warn("%d test records: %s" %(counts[check], check))
+        sys.exit(1)
+
+    def main(self):
+        """Main method of the log validation object"""
+
+        self.parse_options()
+        self.apply_options()
+        self.run()
+
+# this only runs if the module was *not* imported
+if __name__ == '__main__':
+    LogValidation().main()
@@ -19,16 +19,20 @@
 import os
 import os.path
 from logging import debug, warn, error
-from sqlite3 import dbapi2 as sqlite
-import numpy
 import scipy.stats
 import sys
 
 # tcp-eval imports
 from common.functions import call
 from analysis.analysis import Analysis
+from analysis.flowgrinddb import FlowgrindDatabase, requireHeaders
+from analysis.aggregates import aggregateOverX
 from visualization.gnuplot import UmGnuplot, UmLinePointPlot, UmLinePlot
 
+# header keys every test of the multipath measurements has
+HEADERS = ["flowgrind_src", "flowgrind_dst", "scenario_label",
+           "testbed_param_variable"]
+
 class MultipathTCPAnalysis(Analysis):
     """Application for analysis of flowgrind results for multipath tcp."""
 
@@ -92,129 +96,26 @@ class MultipathTCPAnalysis(Analysis):
             error("Please provide me with the variable")
             sys.exit(1)
 
-    def onLoad(self, record, iterationNo, scenarioNo, runNo, test):
-        dbcur = self.dbcon.cursor()
-
-        try:
-            recordHeader   = record.getHeader()
-            src            = recordHeader["flowgrind_src"]
-            dst            = recordHeader["flowgrind_dst"]
-            scenario_label = recordHeader["scenario_label"]
-            variable       = recordHeader["testbed_param_variable"]
-        except:
-            return
-
-        try:
-            qlimit     = int(recordHeader["testbed_param_qlimit"])
-        except KeyError:
-            qlimit     = "NULL"
-
-        try:
-            bnbw       = int(recordHeader["testbed_param_bottleneckbw"])
-        except KeyError:
-            bnbw       = "NULL"
-
-        try:
-            delay      = int(recordHeader["testbed_param_delay"])
-        except KeyError:
-            delay      = "NULL"
-
-        # test_start_time was introduced later in the header, so its not in old test logs
-        try:
-            start_time = int(float(recordHeader["test_start_time"]))
-        except KeyError:
-            start_time = 0
-
-        rtt             = record.calculate("rtt_avg")
-        rtt_min         = record.calculate("rtt_min")
-        rtt_max         = record.calculate("rtt_max")
-
-        thruput         = record.calculate("thruput_recv")
-        flow_ids        = record.calculate("flow_ids");
-
-        if not thruput:
-            if not self.failed.has_key(scenario_label):
-                self.failed[scenario_label] = 1
-            else:
-                self.failed[scenario_label] = self.failed[scenario_label] + 1
-            return
-
-        if thruput == 0:
-            warn("Throughput is 0 in %s!" %record.filename)
-
-        try:
-            rtt_min = float(rtt_min)
-        except TypeError, inst:
-            rtt_min = "NULL"
-
-        try:
-            rtt_max = float(rtt_max)
-        except TypeError, inst:
-            rtt_max = "NULL"
-
-        try:
-            rtt = float(rtt)
-        except TypeError, inst:
-            rtt = "NULL"
-
-        dbcur.execute("""
-        INSERT INTO tests VALUES ("%s", %s, %s, %s, %u, "%s", %u, %u, %u, "%s", "%s","%s", %f, %s, %s, %s, %u)
-        """ % (variable,  bnbw, qlimit, delay, start_time, scenario_label, iterationNo, scenarioNo, runNo, test, src, dst, thruput, rtt_min, rtt_max, rtt, len(flow_ids)))
-
-        # calculate per flow values
-        if len(flow_ids) > 1:
-            for flow_id in flow_ids:
-                rtt             = record.calculate("rtt_avg_list")[flow_id]
-                rtt_min         = record.calculate("rtt_min_list")[flow_id]
-                rtt_max         = record.calculate("rtt_max_list")[flow_id]
-
-                thruput         = record.calculate("thruput_recv_list")[flow_id]
-
-                if thruput == 0:
-                    warn("Throughput is 0 in %s for subflow!" %(record.filename, flow_id))
-                    continue
-
-                try:
-                    rtt_min = float(rtt_min)
-                except TypeError, inst:
-                    rtt_min = "NULL"
-
-                try:
-                    rtt_max = float(rtt_max)
-                except TypeError, inst:
-                    rtt_max = "NULL"
-
-                try:
-                    rtt = float(rtt)
-                except TypeError, inst:
-                    rtt = "NULL"
-
-                dbcur.execute("""
-                INSERT INTO single_values VALUES (%u, %u, %u, %u,"%s", %f, %s, %s, %s)
-                """ % (iterationNo, scenarioNo, runNo, flow_id, test, thruput, rtt_min, rtt_max, rtt))
-
-
-    def writeValueTable(self, x, y, scenarioNo, query, filename, cur_max_y_value):
-        dbcur = self.dbcon.cursor()
+    def writeValueTable(self, x, y, rows, filename, cur_max_y_value):
         max_y_value = cur_max_y_value
 
-        debug("\n\n" + query + "\n\n")
-        dbcur.execute(query)
-
         debug("Generating %s..." % filename)
         fhv = file(filename, "w")
 
         # header
-        fhv.write("# %s %s\n" % (x, y))
+        if self.options.plot_error:
+            fhv.write("# %s %s stddev count lower upper\n" % (x, y))
+        else:
+            fhv.write("# %s %s\n" % (x, y))
 
         # data
         success = False
-        for row in dbcur:
-            (x_value, y_value) = row
+        for row in rows:
+            (x_value, y_value, mean, stddev, count, lower, upper) = row
             try:
                 if self.options.plot_error:
-                    stddev = self.calculateStdDev(y, x_value, scenarioNo)
-                    fhv.write("%u %f %f\n" %(x_value, y_value, stddev))
+                    fhv.write("%u %f %f %u %f %f\n" %(x_value, y_value,
+                              stddev, count, lower, upper))
                 else:
                     fhv.write("%u %f\n" %(x_value, y_value))
             except TypeError:
@@ -289,60 +190,51 @@ class MultipathTCPAnalysis(Analysis):
         p.setXLabel(self.plotlabels[x])
         p.setYLabel(self.plotlabels[y])
 
+        # 1) aggregate the iterations of each run of one scenario under one testbed
+        #    configuration by avg() to get the average total y of such flows
+        # 2) sum() up these average values of each scenario under one testbed
+        #    configuration to get the total average y of one scenario under one
+        #    testbed configuration
+        # all scenarios (and subflows) and x values at once, with the
+        # statistics over the iterations for the error bars
+        cells = aggregateOverX(self.dbcon, y, x, where = "variable=?",
+                               params = (x,))
+        if self.options.per_subflow:
+            source = '''
+                (
+                    SELECT t.scenarioNo, s.flowNo, t.iterationNo, t.runNo,
+                           t.%(x)s, s.%(y)s
+                    FROM tests t, single_values s
+                    WHERE t.variable=? AND t.scenarioNo=s.scenarioNo
+                        AND t.iterationNo = s.iterationNo AND t.runNo=s.runNo
+                )''' % {'x' : x, 'y' : y}
+            subflow_cells = aggregateOverX(self.dbcon, y, x, source = source,
+                                           params = (x,),
+                                           by = ("scenarioNo", "flowNo"))
+
         max_y_value = 0
         for scenarioNo in scenarios.keys():
-            # 1) aggregate the iterations of each run of one scenario under one testbed
-            #    configuration by avg() to get the average total y of such flows
-            # 2) sum() up these average values of each scenario under one testbed
-            #    configuration to get the total average y of one scenario under one
-            #    testbed configuration
             if self.options.per_subflow and (subflow_count[scenarioNo] > 1):
                 for flow_id in range(subflow_count[scenarioNo]):
-                    query = '''
-                    SELECT %(x)s, sum(avg_y) AS total_avg_y
-                    FROM
-                    (
-                        SELECT t.%(x)s, t.runNo, avg(s.%(y)s) AS avg_y
-                        FROM tests t, single_values s
-                        WHERE t.scenarioNo=%(scenarioNo)u AND t.variable='%(x)s'
-                            AND t.scenarioNo=s.scenarioNo AND t.iterationNo = s.iterationNo AND t.runNo=s.runNo
-                            AND s.flowNo=%(flowNo)u
-                        GROUP BY t.%(x)s, t.runNo
-                    )
-                    GROUP BY %(x)s
-                    ORDER BY %(x)s
-                    ''' % {'x' : x, 'y' : y, 'scenarioNo' : scenarioNo, 'flowNo' : flow_id}
-
                     plotname = "%s_over_%s_s%u_f%u" % (y, x, scenarioNo, flow_id)
                     valfilename = os.path.join(outdir, plotname+".values")
                     title = '%s (flow %u)' %(scenarios[scenarioNo], flow_id)
 
-                    success, max_y_value = self.writeValueTable(x, y, scenarioNo, query, valfilename, max_y_value)
+                    rows = subflow_cells.get((scenarioNo, flow_id), [])
+                    success, max_y_value = self.writeValueTable(x, y, rows, valfilename, max_y_value)
 
                     if success:
                         self.plotValues(p, title, valfilename, scenarioNo, linestyle[scenarioNo] + flow_id)
 
             else:
-                query = '''
-                    SELECT %(x)s, sum(avg_y) AS total_avg_y
-                    FROM
-                    (
-                        SELECT %(x)s, runNo, avg(%(y)s) AS avg_y
-                        FROM tests
-                        WHERE scenarioNo=%(scenarioNo)u AND variable='%(x)s'
-                        GROUP BY %(x)s, runNo
-                    )
-                    GROUP BY %(x)s
-                    ORDER BY %(x)s
-                ''' % {'x' : x, 'y' : y, 'scenarioNo' : scenarioNo}
-
                 plotname = "%s_over_%s_s%u" % (y, x, scenarioNo)
                 valfilename = os.path.join(outdir, plotname+".values")
                 title = scenarios[scenarioNo]
                 if subflow_count[scenarioNo] > 1:
                     title += ' combined'
 
-                success, max_y_value = self.writeValueTable(x, y, scenarioNo, query, valfilename, max_y_value)
+                rows = cells.get((scenarioNo,), [])
+                success, max_y_value = self.writeValueTable(x, y, rows, valfilename, max_y_value)
 
                 if success:
                     self.plotValues(p, scenarios[scenarioNo], valfilename, scenarioNo, linestyle[scenarioNo])
@@ -353,72 +245,44 @@ class MultipathTCPAnalysis(Analysis):
 
         p.save()
 
-    def calculateStdDev(self, y, x_value, scenarioNo):
-        """Calculates the standarddeviation for the values of the YoverXPlot
-        """
-
-        x = self.options.variable
-        dbcur = self.dbcon.cursor()
-
-        query = '''
-            SELECT sum(%s) AS sum_y
-            FROM tests
-            WHERE %s=%u AND scenarioNo=%u AND variable='%s'
-            GROUP BY iterationNo
-        ''' % (y, x, x_value, scenarioNo, x)
-
-        dbcur.execute(query)
-        ary = numpy.array(dbcur.fetchall())
-        return ary.std()
-
     def run(self):
         """Main Method"""
 
-        # bring up database
-        dbexists = False
-        if os.path.exists('data.sqlite'):
-            dbexists = True
-        self.dbcon = sqlite.connect('data.sqlite')
-
-        if not dbexists:
-            dbcur = self.dbcon.cursor()
-            dbcur.execute("""
-            CREATE TABLE tests (variable        VARCHAR(15),
-                                bnbw            INTEGER,
-                                qlimit          INTEGER,
-                                delay           INTEGER,
-                                start_time      VARCHAR(70),
-                                scenario_label  VARCHAR(70),
-                                iterationNo     INTEGER,
-                                scenarioNo      INTEGER,
-                                runNo           INTEGER,
-                                test            VARCHAR(50),
-                                src             VARCHAR(4),
-                                dst             VARCHAR(4),
-                                thruput         DOUBLE,
-                                rtt_min         DOUBLE,
-                                rtt_max         DOUBLE,
-                                rtt_avg         DOUBLE,
-                                flow_count      INTEGER)
-            """)
-            dbcur.execute("""
-            CREATE TABLE single_values (iterationNo     INTEGER,
-                                        scenarioNo      INTEGER,
-                                        runNo           INTEGER,
-                                        flowNo          INTEGER,
-                                        test            VARCHAR(50),
-                                        thruput         DOUBLE,
-                                        rtt_min         DOUBLE,
-                                        rtt_max         DOUBLE,
-                                        rtt_avg         DOUBLE)
-            """)
-            # store failed test as a mapping from run_label to number
-            self.failed = dict()
-            # only load flowgrind test records
-            self.loadRecords(tests=["multiflowgrind"])
-            self.dbcon.commit()
-        else:
-            warn("Database already exists, don't load records.")
+        # bring up the flowgrind database, only new or changed logs of
+        # the multipath measurements are loaded into it
+        db = FlowgrindDatabase(self)
+        db.ingest(filter = requireHeaders(*HEADERS))
+        db.requireColumns(*HEADERS + ["testbed_param_qlimit",
+                          "testbed_param_bottleneckbw", "testbed_param_delay",
+                          "test_start_time"])
+        self.dbcon = db.dbcon
+
+        # the tests of the plots are the multiflowgrind tests with a
+        # received throughput, subflows are taken from the flows of tests
+        # with more than one flow
+        self.dbcon.execute("""
+        CREATE TEMP VIEW tests AS
+        SELECT testbed_param_variable     AS variable,
+               testbed_param_bottleneckbw AS bnbw,
+               testbed_param_qlimit       AS qlimit,
+               testbed_param_delay        AS delay,
+               coalesce(CAST(test_start_time AS INTEGER), 0) AS start_time,
+               scenario_label, iterationNo, scenarioNo, runNo, test,
+               flowgrind_src              AS src,
+               flowgrind_dst              AS dst,
+               thruput_recv               AS thruput,
+               rtt_min, rtt_max, rtt_avg, flow_count
+        FROM records
+        WHERE test = 'multiflowgrind' AND thruput_recv AND %s
+        """ % " AND ".join(["%s IS NOT NULL" % key for key in HEADERS]))
+        self.dbcon.execute("""
+        CREATE TEMP VIEW single_values AS
+        SELECT iterationNo, scenarioNo, runNo, flowNo, test,
+               flows.thruput_recv AS thruput,
+               flows.rtt_min, flows.rtt_max, flows.rtt_avg
+        FROM flows JOIN tests USING (iterationNo, scenarioNo, runNo, test)
+        WHERE tests.flow_count > 1 AND flows.thruput_recv != 0
+        """)
 
         if self.options.dry_run:
             return
@@ -18,10 +18,12 @@
 import os
 import os.path
 from logging import info, debug, warn, error
+import numpy
 
 # tcp-eval imports
 from um_config import *
 from analysis.analysis import Analysis
+from analysis.pingstats import PingStats
 from visualization.gnuplot import UmPointPlot
 
 class RttAnalysis(Analysis):
@@ -41,63 +43,109 @@ class RttAnalysis(Analysis):
         recordHeader = record.getHeader()
         src = recordHeader["ping_src"]
         dst = recordHeader["ping_dst"]
-        count = int(recordHeader["ping_count"])
+
+        # tests without any packet received count as lost, the number of
+        # packets sent is read first as the record has no lists then
+        sent = record.calculate("pkt_tx", optional = True)
+        if sent is None:
+            sent = int(recordHeader["ping_count"])
 
         # get per packet statistics
-        rtts = record.calculate("rtt_list")
-        seqs = record.calculate("seq_list")
+        rtts = numpy.array(record.calculate("rtt_list", optional = True) or [],
+                           dtype = float)
+        seqs = numpy.array(record.calculate("seq_list", optional = True) or [],
+                           dtype = int)
 
-        # ignore results with no packets received
-        if not rtts:
-            return
+        # ping counts from 1, fping from 0
+        first = 0
+        if test == "ping":
+            first = 1
 
-        key = (src, dst)
+        stats = PingStats()
+        stats.add(rtts, seqs, sent, first)
 
+        key = (src, dst)
         if not self.nodepairs.has_key(key):
-            assoc = dict()
-            self.nodepairs[key] = assoc
+            self.nodepairs[key] = stats
         else:
-            assoc = self.nodepairs[key]
-
-        # only map rtts of packets available
-        for i in range(len(seqs)):
-            # add for every iteration ping_count
-            seq = seqs[i]+(iterationNo)*count
-            rtt = rtts[i]
-            assoc[seq] = rtt
+            self.nodepairs[key].merge(stats)
 
-    def generateRttGraph(self, pair, data):
-        """This function expects a node pair, and a dict
-           which maps sequence numbers to rtt
-        """
+    def generateRttGraph(self, pair, stats):
+        """This function expects a node pair and its PingStats and plots
+           the distribution of the RTTs"""
 
         plotname = "rtt_%s_%s" %pair
         outdir   = self.options.outdir
 
+        self.generateRttDistribution(pair, stats, plotname)
+
+        # lengths of bursts of lost packets
+        valfilename = os.path.join(outdir, plotname+"_bursts.values")
+
+        info("Generating %s" %valfilename)
+        fh = file(valfilename, "w")
+        fh.write("# Loss bursts for ping measurement from %s to %s\n"% pair)
+        fh.write("# burst length (last: or more),  count\n")
+        for length in range(1, len(stats.bursts)):
+            fh.write("%u %u\n" %(length, stats.bursts[length]))
+        fh.close()
+
+    def generateRttDistribution(self, pair, stats, plotname):
+        """Plots the distribution of the RTTs of a node pair, if any packet
+           was received"""
+
+        outdir = self.options.outdir
+        fractions = numpy.linspace(0, 1, 201)
+        rtts = stats.sketch.quantiles(fractions)
+        if rtts is None:
+            warn("No packets received from %s to %s, no RTT distribution" %pair)
+            return
+
         valfilename = os.path.join(outdir, plotname+".values")
 
         info("Generating %s" %valfilename)
         fh = file(valfilename, "w")
 
         # header
-        fh.write("# RTT graph for ping measurement from %s to %s\n"% pair)
-        fh.write("# seq,  rtt\n")
+        fh.write("# RTT distribution for ping measurement from %s to %s\n"% pair)
+        fh.write("# fraction,  rtt\n")
 
-        # sort by sequence number
-        skeys = data.keys()
-        skeys.sort()
-
-        for key in skeys:
-            fh.write("%u %f\n" %(key,data[key]))
+        for (fraction, rtt) in zip(fractions, rtts):
+            fh.write("%f %f\n" %(fraction, rtt))
         fh.close()
 
-        p = UmPointPlot(plotname)
-        p.setYLabel("RTT in ms")
-        p.setXLabel("ICMP sequence number")
-        p.plot(valfilename, "RTT")
+        p = UmPointPlot(plotname, outdir, debug = self.options.debug)
+        p.setYLabel("Fraction of packets")
+        p.setXLabel("RTT in ms")
+        p.plot(valfilename, "RTT", using = "2:1")
 
         # output plot
-        p.save(self.options.outdir, self.options.debug, self.options.cfgfile)
+        p.save()
+
+    def generateRttSummary(self):
+        """Writes the statistics of all node pairs into one table"""
+
+        valfilename = os.path.join(self.options.outdir, "rtt_summary.values")
+
+        info("Generating %s" %valfilename)
+        fh = file(valfilename, "w")
+        fh.write("# src dst sent received loss rtt_min rtt_avg rtt_p50 rtt_p90 rtt_p99 rtt_max\n")
+        # pairs without any packet received have no RTTs
+        def value(x):
+            if x is None:
+                return "-"
+            return "%f" % x
+
+        for pair in sorted(self.nodepairs):
+            stats = self.nodepairs[pair]
+            quantiles = stats.sketch.quantiles([0.5, 0.9, 0.99])
+            if quantiles is None:
+                quantiles = [None] * 3
+            values = [stats.loss(), stats.min, stats.mean()] + list(quantiles) \
+                    + [stats.max]
+            fh.write("%s %s %u %u %s\n" %(pair + (stats.sent, stats.received,
+                     " ".join(map(value, values)))))
+        fh.close()
 
     def run(self):
         """Main Method"""
@@ -108,6 +156,7 @@ class RttAnalysis(Analysis):
         # for each pair generate an graph
         for pair in self.nodepairs:
             self.generateRttGraph(pair, self.nodepairs[pair])
+        self.generateRttSummary()
 
     def main(self):
         """Main method of the ping stats object"""
@@ -18,16 +18,22 @@
 import os
 import os.path
 from logging import info, debug, warn, error
-from sqlite3 import dbapi2 as sqlite
-import numpy
 import scipy.stats
 import sys
 
 # tcp-eval imports
 from common.functions import call
 from analysis.analysis import Analysis
+from analysis.flowgrinddb import FlowgrindDatabase, requireHeaders
+from analysis.logvalidator import validateLog
+from analysis.aggregates import aggregateOverX
 from visualization.gnuplot import UmGnuplot, UmLinePointPlot
 
+# header keys every test of the reordering measurements has
+HEADERS = ["flowgrind_src", "flowgrind_dst", "run_label", "scenario_label",
+           "testbed_param_variable", "testbed_param_reordering",
+           "testbed_param_qlimit", "testbed_param_rrate", "testbed_param_rdelay"]
+
 class ReorderingAnalysis(Analysis):
     """Application for analysis of flowgrind results.
        It needs flowlogs produced by the -tcp-more-info branch to fully work.
@@ -54,7 +60,8 @@ class ReorderingAnalysis(Analysis):
                          help = "Plot error bars")
         self.parser.add_option('-d', '--dry-run',
                         action = "store_true", dest = "dry_run",
-                        help = "Test the flowlogs only")
+                        help = "Check the flowlogs for lost SYNs, long "\
+                               "connection establishment and failed flows only")
         self.parser.add_option('-F', '--fairness',
                         action = "store_true", dest = "fairness",
                         help = "Plot fairness instead")
@@ -89,113 +96,26 @@ class ReorderingAnalysis(Analysis):
             sys.exit(1)
 
 
-    def onLoad(self, record, iterationNo, scenarioNo, runNo, test):
-        dbcur = self.dbcon.cursor()
+    def checkRecords(self):
+        """Checks the flowgrind logs for problems like lost SYNs and long
+           connection establishment, see validateLog(). Returns the number
+           of logs with problems."""
 
-        try:
-            recordHeader   = record.getHeader()
-            src            = recordHeader["flowgrind_src"]
-            dst            = recordHeader["flowgrind_dst"]
-            run_label      = recordHeader["run_label"]
-            scenario_label = recordHeader["scenario_label"]
-            variable       = recordHeader["testbed_param_variable"]
-            reordering     = recordHeader["testbed_param_reordering"]
-            qlimit         = int(recordHeader["testbed_param_qlimit"])
-            rrate          = int(recordHeader["testbed_param_rrate"])
-            rdelay         = int(recordHeader["testbed_param_rdelay"])
-        except:
-            return
+        found = self.findRecords(["flowgrind"])
+        failed = 0
+        for (iterationNo, scenarioNo, runNo, test, entry) in found:
+            problems = validateLog(entry)["problems"]
+            for problem in problems:
+                if problem["check"] == "long_setup":
+                    warn("Long connection establishment (%s): %s"
+                            %(problem["detail"], entry))
+                else:
+                    warn("%s: %s" %(entry, problem["detail"]))
+            if problems:
+                failed += 1
 
-        try:
-            bnbw       = int(recordHeader["testbed_param_bottleneckbw"])
-        except KeyError:
-            bnbw       = "NULL"
-
-        try:
-            delay      = 2 * float(recordHeader["testbed_param_delay"])
-        except KeyError:
-            delay      = "NULL"
-
-        try:
-            ackreor    = int(recordHeader["testbed_param_ackreor"])
-        except KeyError:
-            ackreor    = "NULL"
-
-        try:
-            ackloss    = int(recordHeader["testbed_param_ackloss"])
-        except KeyError:
-            ackloss    = "NULL"
-
-        # test_start_time was introduced later in the header, so its not in old test logs
-        try:
-            start_time = int(float(recordHeader["test_start_time"]))
-        except KeyError:
-            start_time = 0
-        rtos           = record.calculate("total_rto_retransmits")
-        frs            = record.calculate("total_fast_retransmits")
-        thruput        = record.calculate("thruput")
-        try:
-            rtt_avg        = record.calculate("rtt_avg")
-        except KeyError:
-            # accept measurements without RTT field
-            rtt_avg        = 0
-
-        # rtt_avg is measured in ms but we want second scale
-        if rtt_avg:
-            rtt_avg = rtt_avg / 1000
-        else:
-            rtt_avg = 0
-        dsacks = record.calculate("total_dsacks")
-
-        if not thruput:
-            if not self.failed.has_key(run_label):
-                self.failed[run_label] = 1
-            else:
-                self.failed[run_label] = self.failed[run_label]+1
-            return
-        if thruput == 0:
-            warn("Throughput is 0 in %s!" %record.filename)
-
-        try:
-            rtos = int(rtos)
-        except TypeError, inst:
-            rtos = "NULL"
-
-        try:
-            frs = int(frs)
-        except TypeError, inst:
-            frs = "NULL"
-
-        # check for lost SYN or long connection establishing
-        c = 0
-        try:
-            flow_S = record.calculate("flows")[0]['S']
-            for tput in flow_S['tput']:
-                if tput == 0.000000:
-                    c += 1
-                else: break
-            if flow_S['end'][c] > 1:
-                warn("Long connection establishment (%ss): %s" %(flow_S['end'][c], record.filename))
-        except:
-            warn("calculate(flows) failed")
-
-        debug("""
-              INSERT INTO tests VALUES ("%s", "%s", %s, %u, %u, %u, %u, %u, %u, %s, %s, %u, %u,
-                    %u, "%s", "%s", %f, %f, %u,
-                    %u, "$%s$", "%s", "%s")
-              """ % (variable, reordering, bnbw, qlimit, delay, rrate, rdelay,
-                     ackreor, ackloss, rtos, frs, iterationNo, scenarioNo, runNo,
-                     src, dst, thruput, rtt_avg, dsacks, start_time, run_label,
-                     scenario_label, test))
-
-        dbcur.execute("""
-                      INSERT INTO tests VALUES ("%s", "%s", %s, %u, %u, %u, %u, %u, %u, %s, %s, %u, %u,
-                            %u, "%s", "%s", %f, %f, %u,
-                            %u, "$%s$", "%s", "%s")
-                      """ % (variable, reordering, bnbw, qlimit, delay, rrate,
-                             rdelay, ackreor, ackloss, rtos, frs, iterationNo,
-                             scenarioNo, runNo, src, dst, thruput, rtt_avg,
-                             dsacks, start_time, run_label, scenario_label, test))
+        info("Checked %d test records, %d have problems." %(len(found), failed))
+        return failed
 
     def generateFairnessOverXLinePlot(self):
         """Generates a line plot of the DB column y over the DB column x
@@ -223,19 +143,27 @@ class ReorderingAnalysis(Analysis):
         p.setYLabel(self.plotlabels[y])
 
         for scenarioNo in scenarios:
+            # Jain's fairness index of the average thruput of the flows,
+            # one flow per scenario label
             query = '''
-                SELECT bnbw,avg(thruput),scenario_label
-                FROM tests
-                WHERE scenarioNo=%s
-                GROUP BY scenario_label, bnbw
+                SELECT bnbw, jain(avg_thruput)
+                FROM
+                (
+                    SELECT bnbw, scenario_label, avg(thruput) AS avg_thruput
+                    FROM tests
+                    WHERE scenarioNo=?
+                    GROUP BY scenario_label, bnbw
+                )
+                GROUP BY bnbw
                 ORDER BY bnbw;
-            ''' %scenarioNo
+            '''
             debug("\n\n" + query + "\n\n")
-            fairness = dbcur.execute(query).fetchall()
+            fairness = dbcur.execute(query, (scenarioNo,)).fetchall()
+            labels = [row[0] for row in dbcur.execute('''
+                SELECT DISTINCT scenario_label FROM tests WHERE scenarioNo=?
+                ORDER BY scenario_label''', (scenarioNo,))]
 
             # fairness plot
-            k = 0
-            j = 1
             plotname = "%s_%s_over_%s_s%u" % (rotype, y, x, scenarioNo)
             valfilename = os.path.join(outdir, plotname+".values")
 
@@ -245,19 +173,12 @@ class ReorderingAnalysis(Analysis):
             # header
             fhv.write("# %s %s\n" % (x, y))
 
-            # Jain's fairness index
-            for i in range(0, len(fairness), 2):
-                try:
-                    zaehler = (fairness[i][1] + fairness[i+1][1])**2
-                    nenner = 2 * (fairness[i][1]**2 + fairness[i+1][1]**2)
-                    jain_index = float(zaehler)/float(nenner)
-                except: jain_index = 0
-
-                fhv.write("%s %s\n" %(fairness[i][0], jain_index))
+            for (bnbw, jain_index) in fairness:
+                fhv.write("%s %s\n" %(bnbw, jain_index or 0))
 
             fhv.close()
 
-            p.plot(valfilename, "%s - %s" %(fairness[0][2], fairness[1][2]), linestyle=scenarioNo, using="1:2")
+            p.plot(valfilename, " - ".join(labels), linestyle=scenarioNo, using="1:2")
 
         # make room for the legend
         p.setYRange("[0.5:1.1]")
@@ -289,28 +210,19 @@ class ReorderingAnalysis(Analysis):
         p.setYLabel(self.plotlabels[y])
         #p.setLogScale()
 
+        # 1) aggregate the iterations of each run of one scenario under one testbed
+        #    configuration by avg() to get the average total y of such flows
+        # 2) sum() up these average values of each scenario under one testbed
+        #    configuration to get the total average y of one scenario under one
+        #    testbed configuration
+        # all scenarios and x values at once, with the statistics over the
+        # iterations for the error bars
+        cells = aggregateOverX(self.dbcon, y, x,
+                               where = "variable=? AND reordering=?",
+                               params = (x, rotype))
+
         max_y_value = 0
         for scenarioNo in scenarios.keys():
-            # 1) aggregate the iterations of each run of one scenario under one testbed
-            #    configuration by avg() to get the average total y of such flows
-            # 2) sum() up these average values of each scenario under one testbed
-            #    configuration to get the total average y of one scenario under one
-            #    testbed configuration
-            query = '''
-                SELECT %s, sum(avg_y) AS total_avg_y
-                FROM
-                (
-                    SELECT %s, runNo, avg(%s) AS avg_y
-                    FROM tests
-                    WHERE scenarioNo=%u AND variable='%s' AND reordering='%s'
-                    GROUP BY %s, runNo
-                )
-                GROUP BY %s
-                ORDER BY %s
-            ''' % (x, x, y, scenarioNo, x, rotype, x, x, x)
-            debug("\n\n" + query + "\n\n")
-            dbcur.execute(query)
-
             plotname = "%s_%s_over_%s_s%u" % (rotype, y, x, scenarioNo)
             valfilename = os.path.join(outdir, plotname+".values")
 
@@ -318,19 +230,22 @@ class ReorderingAnalysis(Analysis):
             fhv = file(valfilename, "w")
 
             # header
-            fhv.write("# %s %s\n" % (x, y))
+            if self.options.plot_error:
+                fhv.write("# %s %s stddev count lower upper\n" % (x, y))
+            else:
+                fhv.write("# %s %s\n" % (x, y))
 
             # data
             success = False
-            for row in dbcur:
-                (x_value, y_value) = row
+            for row in cells.get((scenarioNo,), []):
+                (x_value, y_value, mean, stddev, count, lower, upper) = row
                 # skip bogus rtt measurements
                 if (y == "rtt_avg" and y_value == 0):
                     continue
                 try:
                     if self.options.plot_error:
-                        stddev = self.calculateStdDev(y, x_value, scenarioNo)
-                        fhv.write("%u %f %f\n" %(x_value, y_value, stddev))
+                        fhv.write("%u %f %f %u %f %f\n" %(x_value, y_value,
+                                  stddev, count, lower, upper))
                     else:
                         fhv.write("%u %f\n" %(x_value, y_value))
                 except TypeError:
@@ -354,72 +269,59 @@ class ReorderingAnalysis(Analysis):
             p.setYRange("[0:%u]" % max(1, int(max_y_value * 1.30)))
         p.save()
 
-    def calculateStdDev(self, y, x_value, scenarioNo):
-        """Calculates the standarddeviation for the values of the YoverXPlot
-        """
-
-        x      = self.options.variable
-        rotype = self.options.rotype
-        dbcur  = self.dbcon.cursor()
-
-        query = '''
-            SELECT sum(%s) AS sum_y
-            FROM tests
-            WHERE %s=%u AND scenarioNo=%u AND variable='%s' AND reordering='%s'
-            GROUP BY iterationNo
-        ''' % (y, x, x_value, scenarioNo, x, rotype)
-
-        dbcur.execute(query)
-        ary = numpy.array(dbcur.fetchall())
-        return ary.std()
-
     def run(self):
         """Main Method"""
 
-        # bring up database
-        dbexists = False
-        if os.path.exists('data.sqlite'):
-            dbexists = True
-        self.dbcon = sqlite.connect('data.sqlite')
-
-        if not dbexists:
-            dbcur = self.dbcon.cursor()
-            dbcur.execute("""
-            CREATE TABLE tests (variable    VARCHAR(15),
-                                reordering  VARCHAR(15),
-                                bnbw        INTEGER,
-                                qlimit      INTEGER,
-                                delay       INTEGER,
-                                rrate       INTEGER,
-                                rdelay      INTEGER,
-                                ackreor     INTEGER,
-                                ackloss     INTEGER,
-                                rtos        INTEGER,
-                                frs         INTEGER,
-                                iterationNo INTEGER,
-                                scenarioNo  INTEGER,
-                                runNo       INTEGER,
-                                src         INTEGER,
-                                dst         INTEGER,
-                                thruput     DOUBLE,
-                                rtt_avg     DOUBLE,
-                                dsacks      INTEGER,
-                                start_time  INTEGER,
-                                run_label   VARCHAR(70),
-                                scenario_label VARCHAR(70),
-                                test        VARCHAR(50))
-            """)
-            # store failed test as a mapping from run_label to number
-            self.failed = dict()
-            # only load flowgrind test records
-            self.loadRecords(tests=["flowgrind"])
-            self.dbcon.commit()
-        else:
-            info("Database already exists, don't load records.")
-
         if self.options.dry_run:
+            self.checkRecords()
             return
 
+        # bring up the flowgrind database, only new or changed logs of
+        # the reordering measurements are loaded into it
+        db = FlowgrindDatabase(self)
+        db.ingest(filter = requireHeaders(*HEADERS))
+        db.requireColumns(*HEADERS + ["testbed_param_bottleneckbw",
+                          "testbed_param_delay", "testbed_param_ackreor",
+                          "testbed_param_ackloss", "test_start_time"])
+        self.dbcon = db.dbcon
+        headers = " AND ".join(["%s IS NOT NULL" % key for key in HEADERS])
+
+        # the tests of the plots are the flowgrind tests with all headers
+        # of the reordering measurements and a throughput
+        self.dbcon.execute("""
+        CREATE TEMP VIEW tests AS
+        SELECT testbed_param_variable     AS variable,
+               testbed_param_reordering   AS reordering,
+               testbed_param_bottleneckbw AS bnbw,
+               testbed_param_qlimit       AS qlimit,
+               2 * testbed_param_delay    AS delay,
+               testbed_param_rrate        AS rrate,
+               testbed_param_rdelay       AS rdelay,
+               testbed_param_ackreor      AS ackreor,
+               testbed_param_ackloss      AS ackloss,
+               total_rto_retransmits      AS rtos,
+               total_fast_retransmits     AS frs,
+               iterationNo, scenarioNo, runNo,
+               flowgrind_src              AS src,
+               flowgrind_dst              AS dst,
+               thruput,
+               coalesce(rtt_avg, 0) / 1000.0 AS rtt_avg,
+               NULL                       AS dsacks,
+               coalesce(CAST(test_start_time AS INTEGER), 0) AS start_time,
+               '$' || run_label || '$'    AS run_label,
+               scenario_label, test
+        FROM records
+        WHERE test = 'flowgrind' AND thruput AND %s
+        """ % headers)
+
+        # store failed test as a mapping from run_label to number
+        self.failed = dict(self.dbcon.execute("""
+            SELECT run_label, count(*) FROM records
+            WHERE test = 'flowgrind' AND NOT coalesce(thruput, 0) AND %s
+            GROUP BY run_label""" % headers).fetchall())
+        for (run_label, count) in sorted(self.failed.iteritems()):
+            warn("%u tests of run %s failed" %(count, run_label))
+
         # Do Plots
         if self.options.fairness:
             self.generateFairnessOverXLinePlot()
@@ -17,15 +17,19 @@
 # python imports
 import os
 import os.path
+import socket
 from logging import info, debug, warn, error
-from sqlite3 import dbapi2 as sqlite
 import numpy
 import scipy.stats
 
 # tcp-eval imports
 from common.functions import call
 from analysis.analysis import Analysis
-from visualization.gnuplot import UmHistogram, UmGnuplot, UmLinePlot, UmBoxPlot
+from analysis.recordsink import RecordSink
+from analysis.bootstrap import bootstrap
+from analysis.sketch import QuantileSketch, loadSketch
+from analysis.fairness import alignFlows, windowMeans, nanMean, fairnessOverTime, overallFairness
+from visualization.gnuplot import UmHistogram, UmGnuplot, UmLinePlot, UmBoxPlot, UmLinePointPlot, UmStepPlot
 
 class TcpAnalysis(Analysis):
     """Application for analysis of flowgrind results"""
@@ -33,12 +37,31 @@ class TcpAnalysis(Analysis):
     def __init__(self):
         Analysis.__init__(self)
 
+        self.parser.add_argument("--resamples", metavar = "n", type = int,
+                        action = "store", dest = "resamples", default = 1000,
+                        help = "Number of bootstrap resamples for the "\
+                               "confidence intervals [default: %(default)s]")
+        self.parser.add_argument("--sketches", metavar = "FILE",
+                        action = "store", dest = "sketches",
+                        default = "tput_sketches.sqlite",
+                        help = "Store the throughput sketches of every run "\
+                               "and scenario in FILE, relative to the output "\
+                               "directory [default: %(default)s]")
+        self.parser.add_argument("--merge-sketches", metavar = "FILE",
+                        action = "append", dest = "merge_sketches", default = [],
+                        help = "Merge the throughput sketches of another "\
+                               "analysis, e.g. of a part of the sweep analysed "\
+                               "on another host, may be given multiple times")
+        self.parser.add_argument("--fairness-window", metavar = "SECONDS",
+                        action = "store", type = float, dest = "fairness_window",
+                        default = 1.0,
+                        help = "Length of the time windows of the fairness "\
+                               "of concurrent flows [default: %(default)s]")
+
     def onLoad(self, record, iterationNo, scenarioNo, runNo, test):
         if test == "rate":
             return self.onLoadRate(record, iterationNo, scenarioNo, runNo, test)
 
-        dbcur = self.dbcon.cursor()
-
         recordHeader = record.getHeader()
         src = recordHeader["src"]
         dst = recordHeader["dst"]
@@ -68,19 +91,37 @@ class TcpAnalysis(Analysis):
             thruput_0 = 0.0
             thruput_1 = 0.0
 
-	#print """
-        #      INSERT INTO tests VALUES (%u, %u, %u, %s, %s, %f, %f, %f, %u, "$%s$", "%s", "%s")
-        #      """ % (iterationNo, scenarioNo, runNo, src, dst, thruput, thruput_0, thruput_1,
-        #             start_time, run_label, scenario_label, test)
+        self.sink.insert("tests", iterationNo, scenarioNo, runNo, src, dst,
+                         thruput, thruput_0, thruput_1, start_time,
+                         "$%s$" % run_label, scenario_label, test)
+        self.sink.endRecord()
 
-        dbcur.execute("""
-                      INSERT INTO tests VALUES (%u, %u, %u, "%s", "%s", %f, %f, %f, %u, "$%s$", "%s", "%s")
-                      """ % (iterationNo, scenarioNo, runNo, src, dst, thruput, thruput_0, thruput_1,
-                             start_time, run_label, scenario_label, test))
+        if len(thruput_list) > 1:
+            self.addFairness(record, iterationNo, scenarioNo, runNo)
 
-    def onLoadRate(self, record, iterationNo, scenarioNo, runNo, test):
-        dbcur = self.dbcon.cursor()
+    def addFairness(self, record, iterationNo, scenarioNo, runNo):
+        """Keeps the throughput of the concurrent flows of a record averaged
+           over the fairness windows and over the whole test."""
+
+        flows = record.calculate("flows", optional = True)
+        if not flows or len(flows) < 2:
+            return
 
+        interval = record.calculate("reporting_interval", optional = True)
+        if not interval:
+            # intervals of the first flow with some
+            ends = [flow['S']['end'] for flow in flows if flow['S'].size > 1]
+            if not ends:
+                return
+            interval = numpy.median(numpy.diff(ends[0]))
+
+        matrix = alignFlows(flows, interval)
+        size = max(1, int(round(self.args.fairness_window / interval)))
+        self.fairness.setdefault((runNo, scenarioNo), list()).append(
+                (iterationNo, windowMeans(matrix, size),
+                 nanMean(matrix, axis = 1)[:, None]))
+
+    def onLoadRate(self, record, iterationNo, scenarioNo, runNo, test):
         recordHeader = record.getHeader()
         src = recordHeader["rate_src"]
         dst = recordHeader["rate_dst"]
@@ -93,9 +134,173 @@ class TcpAnalysis(Analysis):
         if not avg_rate:
             return
 
-        dbcur.execute("""
-                      INSERT INTO tests_rate VALUES (%u, %u, %u, %f)
-                      """ % (iterationNo,scenarioNo,runNo,avg_rate))
+        self.sink.insert("tests_rate", iterationNo, scenarioNo, runNo, avg_rate)
+        self.sink.endRecord()
+
+    def bootstrapThruput(self, columns = ("thruput",), by = "run_label, scenarioNo"):
+        """Computes bootstrap confidence intervals of mean and median of the
+           given columns of tests for every group given by the columns by.
+           Returns a dictionary mapping (column, group values...) to the
+           intervals as returned by bootstrap()."""
+
+        groups = dict()
+        for row in self.dbcon.execute("SELECT %s, %s FROM tests"
+                                      %(by, ", ".join(columns))):
+            key = row[:-len(columns)]
+            for (column, value) in zip(columns, row[-len(columns):]):
+                groups.setdefault((column,) + key, list()).append(value)
+
+        return bootstrap(groups, resamples = self.args.resamples)
+
+    def updateSketches(self):
+        """Sketches the throughput of the loaded tests for every run and
+           scenario and stores the sketches in the sketch database, replacing
+           the ones of an earlier analysis of the same input directory."""
+
+        sketches = dict()
+        labels = dict()
+        dbcur = self.dbcon.cursor()
+        dbcur.execute('''
+        SELECT runNo, scenarioNo, run_label, scenario_label
+        FROM tests GROUP BY runNo, scenarioNo''')
+        for (runNo, scenarioNo, run_label, scenario_label) in dbcur:
+            sketches[(runNo, scenarioNo)] = QuantileSketch()
+            labels[(runNo, scenarioNo)] = (run_label, scenario_label)
+
+        # the values are added in blocks, so they are never loaded at once
+        dbcur.execute("SELECT runNo, scenarioNo, thruput FROM tests")
+        while True:
+            rows = dbcur.fetchmany(65536)
+            if not rows:
+                break
+            ary = numpy.array(rows, dtype = float)
+            keys = ary[:, :2].astype(int)
+            for (runNo, scenarioNo) in set(map(tuple, keys)):
+                mask = (keys[:, 0] == runNo) & (keys[:, 1] == scenarioNo)
+                sketches[(runNo, scenarioNo)].add(ary[mask, 2])
+
+        shard = "%s:%s" %(socket.gethostname(), os.path.abspath(self.args.indir))
+        filename = os.path.join(self.args.outdir, self.args.sketches)
+        info("Storing %u throughput sketches in %s" %(len(sketches), filename))
+
+        dbcon = self.connect(filename)
+        dbcon.execute("""
+        CREATE TABLE IF NOT EXISTS sketches (shard          TEXT,
+                                             runNo          INTEGER,
+                                             scenarioNo     INTEGER,
+                                             run_label      VARCHAR(70),
+                                             scenario_label VARCHAR(70),
+                                             count          INTEGER,
+                                             sketch         BLOB)
+        """)
+        dbcon.execute("DELETE FROM sketches WHERE shard = ?", (shard,))
+        dbcon.executemany("INSERT INTO sketches VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(shard, runNo, scenarioNo) + labels[(runNo, scenarioNo)]
+                 + (sketch.count(), buffer(sketch.dumps()))
+                 for ((runNo, scenarioNo), sketch) in sorted(sketches.iteritems())])
+        dbcon.commit()
+        dbcon.close()
+
+    def loadSketches(self):
+        """Loads the throughput sketches of the sketch database and the ones
+           to merge, and merges the sketches of every run and scenario. Sets
+           sketches to a dictionary mapping (runNo, scenarioNo) to the merged
+           sketch, and runs and scenarios to dictionaries of their labels."""
+
+        self.sketches = dict()
+        self.runs = dict()
+        self.scenarios = dict()
+
+        # a shard is only merged once, even if it is in several files
+        seen = set()
+        filenames = [os.path.join(self.args.outdir, self.args.sketches)] \
+                + self.args.merge_sketches
+        for filename in filenames:
+            if not os.path.exists(filename):
+                warn("%s: no such sketch database" % filename)
+                continue
+
+            debug("Loading throughput sketches from %s" % filename)
+            dbcon = self.connect(filename)
+            for row in dbcon.execute('''
+            SELECT shard, runNo, scenarioNo, run_label, scenario_label, sketch
+            FROM sketches'''):
+                (shard, runNo, scenarioNo, run_label, scenario_label, data) = row
+                if (shard, runNo, scenarioNo) in seen:
+                    continue
+                seen.add((shard, runNo, scenarioNo))
+
+                sketch = loadSketch(data)
+                key = (runNo, scenarioNo)
+                if key in self.sketches:
+                    self.sketches[key].merge(sketch)
+                else:
+                    self.sketches[key] = sketch
+                self.runs[runNo] = run_label
+                self.scenarios[scenarioNo] = scenario_label
+            dbcon.close()
+
+    def mergedSketch(self, runNo = None):
+        """Returns the merged throughput sketch of all scenarios of a run,
+           or of all runs if runNo is None."""
+
+        merged = QuantileSketch()
+        for ((run, scenarioNo), sketch) in self.sketches.iteritems():
+            if runNo is None or run == runNo:
+                merged.merge(sketch)
+        return merged
+
+    def generateFairness(self):
+        """Generates a line plot of Jain's fairness index of the concurrent
+           flows of the tests over time, averaged over the iterations, with
+           one line per scenario and one plot per run. The fairness of the
+           mean throughput of the flows of every test is written too."""
+
+        outdir = self.args.outdir
+        window = self.args.fairness_window
+        runs = sorted(set([runNo for (runNo, scenarioNo) in self.fairness]))
+
+        for runNo in runs:
+            plotname = "fairness_over_time_r%u" %runNo
+            p = UmLinePlot(plotname = plotname, outdir = outdir)
+            p.setXLabel(r"Time in $\\si{\\second}$")
+            p.setYLabel("Fairness")
+            p.setYRange("[0:1.1]")
+
+            summaryfilename = os.path.join(outdir, "fairness_r%u.values" %runNo)
+            info("Generating %s..." % summaryfilename)
+            fhs = file(summaryfilename, "w")
+            fhs.write("# iterationNo scenarioNo flows fairness\n")
+
+            scenarios = sorted([scenarioNo for (run, scenarioNo) in self.fairness
+                                if run == runNo])
+            for scenarioNo in scenarios:
+                tests = sorted(self.fairness[(runNo, scenarioNo)])
+                iterations = [test[0] for test in tests]
+
+                # all tests of the scenario at once
+                overTime = fairnessOverTime([test[1] for test in tests])
+                overall = overallFairness([test[2] for test in tests])
+
+                for (iterationNo, test, index) in zip(iterations, tests, overall):
+                    fhs.write("%u %u %u %f\n" %(iterationNo, scenarioNo,
+                              len(test[2]), index))
+
+                valfilename = os.path.join(outdir, "%s_s%u.values" %(plotname, scenarioNo))
+                info("Generating %s..." % valfilename)
+                fh = file(valfilename, "w")
+                fh.write("# time fairness tests\n")
+                mean = nanMean(overTime, axis = 0)
+                count = (~numpy.isnan(overTime)).sum(axis = 0)
+                for i in numpy.flatnonzero(count):
+                    fh.write("%f %f %u\n" %((i + 1) * window, mean[i], count[i]))
+                fh.close()
+
+                p.plot(valfilename, self.scenarios.get(scenarioNo, str(scenarioNo)),
+                       using="1:2", linestyle=scenarioNo+1)
+
+            fhs.close()
+            p.save()
 
     def generateTputOverTime(self, orderby="iterationNo, runNo, scenarioNo ASC"):
         """Generates a line plot of the measured throughput regardless of
@@ -340,22 +545,6 @@ class TcpAnalysis(Analysis):
 
         g.save()
 
-    def calculateStdDev(self, rlabel, slabel, key="thruput"):
-        """Calculates the standarddeviation of all values of the same rlabel
-           and scenarioNo
-        """
-
-        dbcur = self.dbcon.cursor()
-
-        query = '''
-        SELECT %s FROM tests WHERE
-        scenario_label="%s" AND run_label="%s";
-        ''' %(key,slabel,rlabel)
-
-        dbcur.execute(query)
-        ary = numpy.array(dbcur.fetchall())
-        return ary.std()
-
     def generateHistogram2Flows(self):
         """ Generates a histogram with scenario labels for two parallel flows"""
 
@@ -377,15 +566,22 @@ class TcpAnalysis(Analysis):
         MIN(thruput) as min_thruput,
         MAX(thruput) as max_thruput,
         AVG(thruput) as avg_thruput,
+        STDDEV(thruput) as std_thruput,
         MIN(thruput_0) as min_thruput_0,
         MAX(thruput_0) as max_thruput_0,
         AVG(thruput_0) as avg_thruput_0,
+        STDDEV(thruput_0) as std_thruput_0,
         MIN(thruput_1) as min_thruput_1,
         MAX(thruput_1) as max_thruput_1,
         AVG(thruput_1) as avg_thruput_1,
+        STDDEV(thruput_1) as std_thruput_1,
         SUM(1)
         FROM tests GROUP BY run_label, scenarioNo ORDER BY avg_thruput DESC, scenarioNo ASC
         ''')
+        rows = dbcur.fetchall()
+
+        # confidence intervals of the mean thruputs
+        cis = self.bootstrapThruput(("thruput", "thruput_0", "thruput_1"))
 
         # outfile
         outdir        = self.args.outdir
@@ -406,36 +602,35 @@ class TcpAnalysis(Analysis):
         keys.sort()
         for key in scenarios.keys():
             val = scenarios[key]
-            fh.write("min_tput_%(v)s max_tput_%(v)s avg_tput_%(v)s std_tput_%(v)s notests_%(v)s " %{ "v" : val })
-            fh.write("min_tput_0%(v)s max_tput_0%(v)s avg_tput_0%(v)s std_tput_0%(v)s notests_%(v)s " %{ "v" : val })
-            fh.write("min_tput_1%(v)s max_tput_1%(v)s avg_tput_1%(v)s std_tput_1%(v)s notests_%(v)s " %{ "v" : val })
+            fh.write("min_tput_%(v)s max_tput_%(v)s avg_tput_%(v)s std_tput_%(v)s notests_%(v)s ci_low_tput_%(v)s ci_high_tput_%(v)s " %{ "v" : val })
+            fh.write("min_tput_0%(v)s max_tput_0%(v)s avg_tput_0%(v)s std_tput_0%(v)s notests_%(v)s ci_low_tput_0%(v)s ci_high_tput_0%(v)s " %{ "v" : val })
+            fh.write("min_tput_1%(v)s max_tput_1%(v)s avg_tput_1%(v)s std_tput_1%(v)s notests_%(v)s ci_low_tput_1%(v)s ci_high_tput_1%(v)s " %{ "v" : val })
         fh.write("\n")
 
         sorted_labels = list()
-        for row in dbcur:
+        for row in rows:
             (rlabel,slabel,sno,
-             min_thruput,max_thruput,avg_thruput,
-             min_thruput_0,max_thruput_0,avg_thruput_0,
-             min_thruput_1,max_thruput_1,avg_thruput_1,
+             min_thruput,max_thruput,avg_thruput,std_thruput,
+             min_thruput_0,max_thruput_0,avg_thruput_0,std_thruput_0,
+             min_thruput_1,max_thruput_1,avg_thruput_1,std_thruput_1,
              notests) = row
 
-            std_thruput  = self.calculateStdDev(rlabel, slabel, "thruput")
-            std_thruput_0 = self.calculateStdDev(rlabel, slabel, "thruput_0")
-            std_thruput_1 = self.calculateStdDev(rlabel, slabel, "thruput_1")
-
             if not data.has_key(rlabel):
                 tmp = list()
                 for key in keys:
-                    tmp.append("0.0 0.0 0.0 0.0 0")
-                    tmp.append("0.0 0.0 0.0 0.0 0")
-                    tmp.append("0.0 0.0 0.0 0.0 0")
+                    tmp.append("0.0 0.0 0.0 0.0 0 0.0 0.0")
+                    tmp.append("0.0 0.0 0.0 0.0 0 0.0 0.0")
+                    tmp.append("0.0 0.0 0.0 0.0 0 0.0 0.0")
                 data[rlabel] = tmp
                 sorted_labels.append(rlabel)
 
-            data[rlabel][sno] = "%s %s %s %s %s %s %s %s %s %s %s %s %s %s %s" % (
-                                 min_thruput,max_thruput,avg_thruput,std_thruput,notests,
-                                 min_thruput_0,max_thruput_0,avg_thruput_0,std_thruput_0,notests,
-                                 min_thruput_1,max_thruput_1,avg_thruput_1,std_thruput_1,notests)
+            (mean, low, high) = cis[("thruput", rlabel, sno)]["mean"]
+            (mean_0, low_0, high_0) = cis[("thruput_0", rlabel, sno)]["mean"]
+            (mean_1, low_1, high_1) = cis[("thruput_1", rlabel, sno)]["mean"]
+            data[rlabel][sno] = "%s %s %s %s %s %s %s %s %s %s %s %s %s %s %s %s %s %s %s %s %s" % (
+                                 min_thruput,max_thruput,avg_thruput,std_thruput,notests,low,high,
+                                 min_thruput_0,max_thruput_0,avg_thruput_0,std_thruput_0,notests,low_0,high_0,
+                                 min_thruput_1,max_thruput_1,avg_thruput_1,std_thruput_1,notests,low_1,high_1)
             debug(row)
 
         i = 0
@@ -461,21 +656,21 @@ class TcpAnalysis(Analysis):
         for i in range(len(keys)):
             key = keys[i]
             #buf = '"%s" using %u:xtic(1) title "%s" ls %u' %(valfilename, 4+(i*5), scenarios[key], i+1)
-            g.plotBar(valfilename, title=scenarios[key]+" combined", using="%u:xtic(1)" %(4+(i*15)), linestyle=(i+1))
-            g.plotBar(valfilename, title=scenarios[key]+" Flow 0", using="%u:xtic(1)" %(9+(i*15)), linestyle=(i+1))
-            g.plotBar(valfilename, title=scenarios[key]+" Flow 1", using="%u:xtic(1)" %(14+(i*15)), linestyle=(i+1))
+            g.plotBar(valfilename, title=scenarios[key]+" combined", using="%u:xtic(1)" %(4+(i*21)), linestyle=(i+1))
+            g.plotBar(valfilename, title=scenarios[key]+" Flow 0", using="%u:xtic(1)" %(11+(i*21)), linestyle=(i+1))
+            g.plotBar(valfilename, title=scenarios[key]+" Flow 1", using="%u:xtic(1)" %(18+(i*21)), linestyle=(i+1))
 
-        # errobars
+        # errobars of the bootstrap confidence intervals
         for i in range(len(keys)):
             # TODO: calculate offset with scenarios and gap
             if i == 0:
-                g.plotErrorbar(valfilename, i, 4+(i*15),5+(i*15), "Standard Deviation")
-                g.plotErrorbar(valfilename, i+1, 9+(i*15),10+(i*15))
-                g.plotErrorbar(valfilename, i+2, 14+(i*15),15+(i*15))
+                g.plotErrorbar(valfilename, i, 4+(i*21),7+(i*21), "95% Confidence Interval", yHigh=8+(i*21))
+                g.plotErrorbar(valfilename, i+1, 11+(i*21),14+(i*21), yHigh=15+(i*21))
+                g.plotErrorbar(valfilename, i+2, 18+(i*21),21+(i*21), yHigh=22+(i*21))
             else:
-                g.plotErrorbar(valfilename, i*3, 4+(i*15),5+(i*15))
-                g.plotErrorbar(valfilename, i*3+1, 9+(i*15),10+(i*15))
-                g.plotErrorbar(valfilename, i*3+2, 14+(i*15),15+(i*15))
+                g.plotErrorbar(valfilename, i*3, 4+(i*21),7+(i*21), yHigh=8+(i*21))
+                g.plotErrorbar(valfilename, i*3+1, 11+(i*21),14+(i*21), yHigh=15+(i*21))
+                g.plotErrorbar(valfilename, i*3+2, 18+(i*21),21+(i*21), yHigh=22+(i*21))
 
         # output plot
         g.save()
@@ -501,9 +696,14 @@ class TcpAnalysis(Analysis):
         MIN(thruput) as min_thruput,
         MAX(thruput) as max_thruput,
         AVG(thruput) as avg_thruput,
+        STDDEV(thruput) as std_thruput,
         SUM(1)
         FROM tests GROUP BY run_label, scenarioNo ORDER BY avg_thruput DESC, scenarioNo ASC
         ''')
+        rows = dbcur.fetchall()
+
+        # confidence intervals of the mean thruput
+        cis = self.bootstrapThruput()
 
         # outfile
         outdir        = self.args.outdir
@@ -524,21 +724,21 @@ class TcpAnalysis(Analysis):
         keys.sort()
         for key in scenarios.keys():
             val = scenarios[key]
-            fh.write("min_tput_%(v)s max_tput_%(v)s avg_tput_%(v)s std_tput_%(v)s notests_%(v)s" %{ "v" : val })
+            fh.write("min_tput_%(v)s max_tput_%(v)s avg_tput_%(v)s std_tput_%(v)s notests_%(v)s ci_low_tput_%(v)s ci_high_tput_%(v)s " %{ "v" : val })
         fh.write("\n")
 
         sorted_labels = list()
-        for row in dbcur:
-            (rlabel,slabel,sno,min_thruput,max_thruput,avg_thruput,notests) = row
-            std_thruput = self.calculateStdDev(rlabel, slabel)
+        for row in rows:
+            (rlabel,slabel,sno,min_thruput,max_thruput,avg_thruput,std_thruput,notests) = row
             if not data.has_key(rlabel):
                 tmp = list()
                 for key in keys:
-                    tmp.append("0.0 0.0 0.0 0.0 0")
+                    tmp.append("0.0 0.0 0.0 0.0 0 0.0 0.0")
                 data[rlabel] = tmp
                 sorted_labels.append(rlabel)
 
-            data[rlabel][sno] = "%s %s %s %s %s" %(min_thruput,max_thruput,avg_thruput,std_thruput,notests)
+            (mean, low, high) = cis[("thruput", rlabel, sno)]["mean"]
+            data[rlabel][sno] = "%s %s %s %s %s %s %s" %(min_thruput,max_thruput,avg_thruput,std_thruput,notests,low,high)
             debug(row)
 
         i = 0
@@ -564,19 +764,75 @@ class TcpAnalysis(Analysis):
         for i in range(len(keys)):
             key = keys[i]
             #buf = '"%s" using %u:xtic(1) title "%s" ls %u' %(valfilename, 4+(i*5), scenarios[key], i+1)
-            g.plotBar(valfilename, title=scenarios[key], using="%u:xtic(1)" %(4+(i*5)), linestyle=(i+1))
+            g.plotBar(valfilename, title=scenarios[key], using="%u:xtic(1)" %(4+(i*7)), linestyle=(i+1))
 
-        # errobars
+        # errobars of the bootstrap confidence intervals
         for i in range(len(keys)):
             # TODO: calculate offset with scenarios and gap
             if i == 0:
-                g.plotErrorbar(valfilename, i, 4+(i*5),5+(i*5), "Standard Deviation")
+                g.plotErrorbar(valfilename, i, 4+(i*7),7+(i*7), "95% Confidence Interval", yHigh=8+(i*7))
             else:
-                g.plotErrorbar(valfilename, i, 4+(i*5),5+(i*5))
+                g.plotErrorbar(valfilename, i, 4+(i*7),7+(i*7), yHigh=8+(i*7))
 
         # output plot
         g.save()
 
+    def generateTputConfidence(self):
+        """Generates a line plot of mean and median throughput over the
+           scenarios with their bootstrap confidence intervals as error bars,
+           one plot per run."""
+
+        dbcur = self.dbcon.cursor()
+
+        # get runs and scenarios
+        dbcur.execute('''
+        SELECT DISTINCT runNo, run_label
+        FROM tests ORDER BY runNo'''
+        )
+        runs = dict()
+        for row in dbcur:
+            (key,val) = row
+            runs[key] = val
+
+        dbcur.execute('''
+        SELECT DISTINCT scenarioNo, scenario_label
+        FROM tests ORDER BY scenarioNo'''
+        )
+        scenarios = dict()
+        for row in dbcur:
+            (key,val) = row
+            scenarios[key] = val
+
+        # intervals of all runs and scenarios at once
+        cis = self.bootstrapThruput(by = "runNo, scenarioNo")
+
+        outdir = self.args.outdir
+        for runNo in sorted(runs.keys()):
+            plotname = "tput_confidence_r%u" %runNo
+            valfilename = os.path.join(outdir, plotname+".values")
+
+            info("Generating %s..." % valfilename)
+            fh = file(valfilename, "w")
+
+            # header
+            fh.write("# scenarioNo mean ci_low ci_high median ci_low ci_high scenario_label\n")
+
+            for scenarioNo in sorted(scenarios.keys()):
+                try:
+                    ci = cis[("thruput", runNo, scenarioNo)]
+                except KeyError:
+                    continue
+                fh.write("%u %f %f %f %f %f %f \"%s\"\n" %((scenarioNo,) + ci["mean"]
+                         + ci["median"] + (scenarios[scenarioNo],)))
+            fh.close()
+
+            p = UmLinePointPlot(plotname = plotname, outdir = outdir)
+            p.setXLabel("Scenario")
+            p.setYLabel(r"Throughput in $\\si{\Mbps}$")
+            p.plotYerror(valfilename, "Mean "+runs[runNo], using="1:2:3:4:xtic(8)", linestyle=2)
+            p.plotYerror(valfilename, "Median "+runs[runNo], using="1:5:6:7:xtic(8)", linestyle=3)
+            p.save()
+
     def generateCumulativeFractionOfPairs(self):
         dbcur = self.dbcon.cursor()
 
@@ -630,43 +886,23 @@ class TcpAnalysis(Analysis):
     def generateTputDistributions(self):
         """Generate a tput histogram"""
 
-        dbcur = self.dbcon.cursor()
-
-        # get scenarios
-        dbcur.execute('''
-        SELECT DISTINCT scenarioNo, scenario_label
-        FROM tests ORDER BY scenarioNo'''
-        )
-        scenarios = dict()
-        for row in dbcur:
-            (key,val) = row
-            scenarios[key] = val
-
-        # and runs
-        dbcur.execute('''
-        SELECT DISTINCT runNo, run_label
-        FROM tests ORDER BY runNo'''
-        )
-        runs = dict()
-        for row in dbcur:
-            (key,val) = row
-            runs[key] = val
-
-
-        # iterate over every scenario and run an generate a grahic
-        for run in runs.iteritems():
+        # iterate over every run an generate a grahic
+        for run in sorted(self.runs.iteritems()):
             self.generateTputDistribution(run, 100)
 
-    def normaltest(self, data, m):
-        ary = numpy.array(data)
-        (hist, bins) = numpy.histogram(ary, bins=m)
+    def normaltest(self, sketch, m):
+        """Chi-square test of the throughput in sketch against the normal
+           distribution with its mean and standard deviation, using m
+           classes."""
+
+        (hist, bins) = sketch.histogram(bins=m)
 
         # number of observations
-        n = len(data)
+        n = sketch.count()
 
         # parameter estimation for the normal distribution
-        mu  = ary.mean()
-        std = ary.std()
+        mu  = sketch.mean()
+        std = sketch.std()
 
         # create normal distribution with these values
         norm = scipy.stats.norm(loc=mu, scale=std)
@@ -678,17 +914,12 @@ class TcpAnalysis(Analysis):
         chi_square = 0
 
         # expected frequencies
-        exp = list()
         for i in range(m):
             left = bins[i]
-            if (m-1)==i:
-                right = ary.max()
-            else:
-                right = bins[i+1]
+            right = bins[i+1]
 
             # compute the expected 0-hyptohesis count for bin i
             hyp = (norm.cdf(right) - norm.cdf(left)) * n
-            exp.append(hyp)
 
             # observed value for bin i
             obs = hist[i]
@@ -699,37 +930,17 @@ class TcpAnalysis(Analysis):
         # degrees of freedom (2 parameters were estimated for normal distribution)
         df = m-2-1
 
-        #info("Chi-Square-Test score (mine) : %f" %chi_square)
-        #(chi_square_score, p_value) = scipy.stats.chisquare(hist, numpy.array(exp))
         chi_p_value = scipy.stats.chisqprob(chi_square, df)
         info("Chi-square test score     : %f" %chi_square)
         info("Chi-square deg. of freed. : %d" %df)
         info("Chi-square test p-value   : %f" %chi_p_value)
         info("Chi-square test passed    : %s" %(chi_p_value > 0.05))
 
-        # omnibus test
-        try:
-            (omnibus_score, omnibus_tail) = scipy.stats.normaltest(data)
-            omnibus_p_value = scipy.stats.chisqprob(omnibus_score, 2)[0]
-            info("Omnibus test score        : %f" %omnibus_score)
-            info("Omnibus test p-value      : %f" %omnibus_p_value)
-            info("Omnibus test 2-tail       : %f" %omnibus_tail)
-            info("Omnibus test passed       : %s" %(omnibus_p_value > 0.05))
-        except:
-            info("Omnibus computation raised an exception!")
-
     def generateTputDistribution(self, run, noBins):
         (runNo, run_label) = run
 
-        dbcur = self.dbcon.cursor()
-        # load data into a numpy array
-        dbcur.execute('''
-        SELECT thruput
-        FROM tests
-        WHERE runNo=%u;
-        ''' %runNo)
-
-        ary = numpy.array(dbcur.fetchall())
+        # merged sketch of all scenarios of the run
+        sketch = self.mergedSketch(runNo)
 
         plotname = "tput_distribution_r%u_b%u" %(runNo, noBins)
 
@@ -743,7 +954,7 @@ class TcpAnalysis(Analysis):
         fh.write("# %s\n" %plotname)
         fh.write("# lower_edge_of_bin tput\n")
 
-        (n, bins) = numpy.histogram(ary, bins=noBins, normed=1)
+        (n, bins) = sketch.histogram(bins=noBins, density=True)
 
         for i in range(len(n)):
             fh.write("%0.2f %f\n" %(bins[i], n[i]))
@@ -754,23 +965,18 @@ class TcpAnalysis(Analysis):
         p.setYLabel("Frequency")
         p.plot(valfilename,"Frequency", using="1:2", linestyle=1)
 
-        mu  = ary.mean()
-        std = ary.std()
-        self.normaltest(ary,noBins)
+        mu  = sketch.mean()
+        std = sketch.std()
+        self.normaltest(sketch,noBins)
 
         f = "exp(-0.5*((x-%f)/%f)**2)/(%f*sqrt(2*pi))" %(mu,std,std)
         p.rawPlot('%s with lines title "Normal Distribution"' %f)
         p.save()
 
     def generateAccTputDistribution(self, noBins):
-        dbcur = self.dbcon.cursor()
-        # load data into a numpy array
-        dbcur.execute('''
-        SELECT thruput
-        FROM tests;
-        ''')
+        # merged sketch of all runs and scenarios
+        sketch = self.mergedSketch()
 
-        ary = numpy.array(dbcur.fetchall())
         plotname = "tput_distribution_acc_b%u" %(noBins)
         outdir = self.args.outdir
         valfilename = os.path.join(outdir, plotname+".values")
@@ -782,17 +988,51 @@ class TcpAnalysis(Analysis):
         fh.write("# %s\n" %plotname)
         fh.write("# lower_edge_of_bin tput\n")
 
-        (n, bins) = numpy.histogram(ary, bins=noBins, normed=1)
+        (n, bins) = sketch.histogram(bins=noBins, density=True)
 
         for i in range(len(n)):
             fh.write("%f %f\n" %(bins[i], n[i]))
         fh.close()
 
+    def generateTputCdf(self):
+        """Generates a step plot of the CDF and one of the CCDF of the
+           throughput from the sketches, one line per run."""
+
+        outdir = self.args.outdir
+        cdf = UmStepPlot(plotname = "tput_cdf", outdir = outdir)
+        cdf.setXLabel(r"Throughput in $\\si{\Mbps}$")
+        cdf.setYLabel("Fraction of Tests")
+        ccdf = UmStepPlot(plotname = "tput_ccdf", outdir = outdir)
+        ccdf.setXLabel(r"Throughput in $\\si{\Mbps}$")
+        ccdf.setYLabel("Fraction of Tests")
+        ccdf.setLogScale("y")
+
+        for (i, (runNo, run_label)) in enumerate(sorted(self.runs.iteritems())):
+            valfilename = os.path.join(outdir, "tput_cdf_r%u.values" %runNo)
+
+            info("Generating %s..." % valfilename)
+            fh = file(valfilename, "w")
+
+            # header
+            fh.write("# throughput CDF of run %u from %u tests\n"
+                     %(runNo, self.mergedSketch(runNo).count()))
+            fh.write("# tput cdf ccdf\n")
+
+            for (tput, fraction) in zip(*self.mergedSketch(runNo).cdf()):
+                fh.write("%f %f %f\n" %(tput, fraction, 1 - fraction))
+            fh.close()
+
+            cdf.plot(valfilename, run_label, using="1:2", linestyle=i+1)
+            ccdf.plot(valfilename, run_label, using="1:3", linestyle=i+1)
+
+        cdf.save()
+        ccdf.save()
+
     def run(self):
         """Main Method"""
 
         # database in memory to access data efficiently
-        self.dbcon = sqlite.connect(':memory:')
+        self.dbcon = self.connect(':memory:')
         dbcur = self.dbcon.cursor()
         dbcur.execute("""
         CREATE TABLE tests (iterationNo INTEGER,
@@ -820,14 +1060,28 @@ class TcpAnalysis(Analysis):
         # store failed test as a mapping from run_label to number
         self.failed = dict()
 
+        # per run and scenario: iteration, window and test means of the
+        # throughput of the flows of tests with concurrent flows
+        self.fairness = dict()
+
         # only load flowgrind test records
+        self.sink = RecordSink(self.dbcon)
         self.loadRecords(tests=["flowgrind","rate"])
 
+        self.sink.flush()
         self.dbcon.commit()
+
+        # distributions are plotted from the sketches of all shards
+        self.updateSketches()
+        self.loadSketches()
+
         self.generateHistogram()
         self.generateHistogram2Flows()
+        self.generateTputConfidence()
         self.generateTputOverTimePerRun()
         self.generateTputOverTime()
+        self.generateTputCdf()
+        self.generateFairness()
         #self.generateTputDistributions()
         #self.generateAccTputDistribution(50)
         #self.generateAccHistogram()
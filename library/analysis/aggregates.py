@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vi:et:sw=4 ts=4
+
+# Copyright (C) 2013 Alexander Zimmermann <alexander.zimmermann@netapp.com>
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms and conditions of the GNU General Public License,
+# version 2, as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for
+# more details.
+
+# python imports
+import math
+from logging import info, debug, warn, error
+import scipy.stats
+
+class StdDev:
+    """Aggregate stddev(x), the population standard deviation of x, like
+       numpy.std(). It is computed in one pass by Welford's method."""
+
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def step(self, value):
+        if value is None:
+            return
+        self.n += 1
+        delta = value - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (value - self.mean)
+
+    def finalize(self):
+        if not self.n:
+            return None
+        return math.sqrt(self.m2 / self.n)
+
+class CoefficientOfVariation(StdDev):
+    """Aggregate cv(x), the standard deviation of x relative to its mean."""
+
+    def finalize(self):
+        if not self.n or not self.mean:
+            return None
+        return math.sqrt(self.m2 / self.n) / self.mean
+
+class Percentile:
+    """Aggregate percentile(x, p), the p-th percentile of x with p between
+       0 and 100. Values between two ranks are interpolated linearly, like
+       numpy.percentile()."""
+
+    def __init__(self):
+        self.values = list()
+        self.p = None
+
+    def step(self, value, p = 50):
+        if value is None:
+            return
+        self.values.append(value)
+        self.p = p
+
+    def finalize(self):
+        if not self.values:
+            return None
+        self.values.sort()
+        rank = (len(self.values) - 1) * self.p / 100.0
+        lower = int(math.floor(rank))
+        upper = min(lower + 1, len(self.values) - 1)
+        return self.values[lower] + (self.values[upper] - self.values[lower]) \
+                * (rank - lower)
+
+class Median(Percentile):
+    """Aggregate median(x)."""
+
+    def step(self, value):
+        Percentile.step(self, value, 50)
+
+class Jain:
+    """Aggregate jain(x), Jain's fairness index of the values of x, which
+       is 1 if all values are equal and 1/n if only one is non-zero."""
+
+    def __init__(self):
+        self.n = 0
+        self.sum = 0.0
+        self.squares = 0.0
+
+    def step(self, value):
+        if value is None:
+            return
+        self.n += 1
+        self.sum += value
+        self.squares += value * value
+
+    def finalize(self):
+        if not self.squares:
+            return None
+        return self.sum * self.sum / (self.n * self.squares)
+
+# aggregates registered by registerAggregates(): name, arguments, class
+AGGREGATES = [("stddev", 1, StdDev),
+              ("cv", 1, CoefficientOfVariation),
+              ("median", 1, Median),
+              ("percentile", 2, Percentile),
+              ("jain", 1, Jain)]
+
+def registerAggregates(dbcon):
+    """Registers the aggregates above with the SQLite connection dbcon."""
+
+    for (name, arguments, aggregate) in AGGREGATES:
+        dbcon.create_aggregate(name, arguments, aggregate)
+
+def aggregateOverX(dbcon, y, x, source = "tests", where = None, params = (),
+                   by = ("scenarioNo",), confidence = 0.95):
+    """Aggregates the column y of source for every value of the column x and
+       every group given by the columns by in a single query. As for the
+       line plots, y is averaged over the iterations of each run and the
+       averages of all runs are summed up to the total y. Mean, standard
+       deviation, count and confidence bounds are computed over the sums of
+       y of each iteration. source may be a table or a subquery, where a
+       condition with params bound to it. The aggregates have to be
+       registered with dbcon, see registerAggregates().
+       Returns a dictionary mapping the tuple of values of by to a list of
+       (x, total y, mean, stddev, count, lower, upper) ordered by x.
+    """
+
+    keys = ", ".join(by)
+    if where:
+        where = "WHERE %s" % where
+    else:
+        where = ""
+
+    query = '''
+        SELECT %(keys)s, x_value, total_y, mean_y, stddev_y, n
+        FROM
+        (
+            SELECT %(keys)s, x_value, sum(avg_y) AS total_y
+            FROM
+            (
+                SELECT %(keys)s, %(x)s AS x_value, runNo, avg(%(y)s) AS avg_y
+                FROM %(source)s %(where)s
+                GROUP BY %(keys)s, %(x)s, runNo
+            )
+            GROUP BY %(keys)s, x_value
+        )
+        JOIN
+        (
+            SELECT %(keys)s, x_value, avg(sum_y) AS mean_y,
+                   stddev(sum_y) AS stddev_y, count(sum_y) AS n
+            FROM
+            (
+                SELECT %(keys)s, %(x)s AS x_value, iterationNo, sum(%(y)s) AS sum_y
+                FROM %(source)s %(where)s
+                GROUP BY %(keys)s, %(x)s, iterationNo
+            )
+            GROUP BY %(keys)s, x_value
+        )
+        USING (%(keys)s, x_value)
+        ORDER BY %(keys)s, x_value
+    ''' % {'keys' : keys, 'x' : x, 'y' : y, 'source' : source, 'where' : where}
+    debug("\n\n" + query + "\n\n")
+
+    cells = dict()
+    for row in dbcon.execute(query, tuple(params) * 2):
+        key = tuple(row[:len(by)])
+        (x_value, total, mean, stddev, n) = row[len(by):]
+
+        lower = upper = mean
+        if n > 1:
+            # confidence interval of the mean from the sample stddev
+            delta = scipy.stats.t.ppf((1 + confidence) / 2, n - 1) * \
+                    stddev / math.sqrt(n - 1)
+            lower = mean - delta
+            upper = mean + delta
+
+        cells.setdefault(key, list()).append((x_value, total, mean, stddev,
+                                              n, lower, upper))
+    return cells
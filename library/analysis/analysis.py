@@ -19,14 +19,43 @@ import sys
 import os
 import os.path
 import re
+import marshal
+import collections
+import multiprocessing
+from sqlite3 import dbapi2 as sqlite
 from logging import info, debug, warn, error
 
 # tcp-eval imports
 from common.application import Application
 from common.functions import call
+from common.manifest import readManifest
+from testrecord import TestRecord, COMPRESSIONS
 from testrecordfactory import TestRecordFactory
+from headerindex import HeaderIndex
+from aggregates import registerAggregates
 #from config import *
 
+# record factory of a worker process of a parallel loadRecords()
+_factory = None
+
+def _parseRecord(job):
+    """Parses a test log in a worker process of loadRecords(). Returns the
+       marshaled state of the record or None if parsing failed, the record
+       is then parsed on demand by the parent."""
+
+    global _factory
+    (entry, test, whats) = job
+    if _factory is None:
+        _factory = TestRecordFactory()
+
+    try:
+        record = _factory.createRecord(entry, test)
+        record.prepare(whats)
+        return marshal.dumps(record.getState())
+    except Exception, inst:
+        debug("%s: parsing failed in worker: %s" %(entry, inst))
+        return None
+
 class Analysis(Application):
     """Framework for UMIC-Mesh analysis"""
 
@@ -63,6 +92,19 @@ class Analysis(Application):
         self.parser.add_argument("-f", "--force",
                         action = "store_true", dest = "force",
                         help = "overwrite existing output")
+        self.parser.add_argument("--no-parse-cache", action = "store_false",
+                        dest = "parse_cache", help = "do not keep parsed "\
+                               "test logs in hidden files next to the logs")
+        self.parser.add_argument("--select", metavar = "KEY=VALUE",
+                        action = "append", dest = "select", default = [],
+                        help = "only load test logs whose header has the "\
+                               "given value for key, may be given multiple times")
+        self.parser.add_argument("-j", "--jobs", metavar = "N", default = 1,
+                        action = "store", type = int, dest = "jobs",
+                        help = "parse test logs in N processes [default: %(default)s]")
+        self.parser.add_argument("--walk", action = "store_true", dest = "walk",
+                        help = "also walk the input directory for test logs "\
+                               "its manifest does not list")
 
     def apply_options(self):
         """Configure object based on the options form the argparser"""
@@ -77,6 +119,21 @@ class Analysis(Application):
             info("%s does not exist, creating. " % self.args.outdir)
             os.mkdir(self.args.outdir)
 
+        TestRecord.parsecache = self.args.parse_cache
+
+        self.selects = list()
+        for select in self.args.select:
+            try:
+                (key, value) = select.split("=", 1)
+            except ValueError:
+                error("%s is not of the form KEY=VALUE, stop." %select)
+                sys.exit(1)
+            self.selects.append((key, value))
+
+        if self.args.jobs < 1:
+            error("number of jobs must be at least 1, stop.")
+            sys.exit(1)
+
     def process(self):
         """Processing of the gathered data"""
         pass
@@ -84,24 +141,122 @@ class Analysis(Application):
     def onLoad(self, record, iterationNo, scenarioNo, runNo, test):
         pass
 
-    def loadRecords(self, onLoad = None, tests = None):
+    def connect(self, database):
+        """Opens the SQLite database of the analysis with the aggregates
+           stddev, cv, median, percentile and jain registered."""
+
+        dbcon = sqlite.connect(database)
+        registerAggregates(dbcon)
+        return dbcon
+
+    def loadRecords(self, onLoad = None, tests = None, filter = None, whats = None,
+                    ledger = None):
         """This function creates testrecords from test log files
            the onLoad function is called with, TestRecord, testname iterationNo
            and scenarioNo. If tests is set only records for these tests are
-           created.  """
+           created. If filter is set only records for which filter returns
+           True when called with the header dictionary are created. Records
+           are filtered by a per-directory header index (see HeaderIndex),
+           so logs that do not match are not opened.
+           Records are passed to onLoad ordered by iteration, scenario and
+           run. With more than one job the logs are parsed in worker
+           processes ahead of onLoad, limited to whats if it is set.
+           If an IngestLedger is given, only logs which are not in the
+           ledger or changed since they were loaded are passed to onLoad.
+           The logs are found by findRecords()."""
 
         if not onLoad:
             onLoad = self.onLoad
 
+        # filter by header given by option and by argument
+        selects = getattr(self, "selects", [])
+        def accept(header):
+            for (key, value) in selects:
+                if header.get(key) != value:
+                    return False
+            return not filter or filter(header)
+        if not (filter or selects):
+            accept = None
+
         info("Loading records...")
 
-        # testnames are only valid with plain text and numbers
-        regex = re.compile("^i(\d+)_s(\d+)_r(\d+)_test_(\w+)$")
-        count = 0
+        found = self.findRecords(tests, accept)
         failed = []
 
+        if ledger:
+            found = ledger.select(found, self.factory.getVersion)
+
+        for (job, state) in self.parseRecords(found, whats):
+            (iterationNo, scenarioNo, runNo, test, entry) = job
+            debug("Processing %s" %entry)
+            if state is not None:
+                state = marshal.loads(state)
+            try:
+                record = self.factory.createRecord(entry, test, state)
+            except IOError, inst:
+                debug("%s: %s" %(entry, inst))
+                failed.append(entry)
+                continue
+
+            # call hook
+            onLoad(record, iterationNo, scenarioNo, runNo, test)
+            if ledger:
+                ledger.add(entry)
+
+        count = len(found)
+        if ledger and ledger.current:
+            info('Found %d new or changed test records, %d are up to date.'
+                    %(count, ledger.current))
+        elif (count == 0):
+            warn('Found no log records in "%s" Stop.' %self.args.indir)
+            sys.exit(0)
+        else:
+            info('Found %d test records.' %count)
+        if failed:
+            warn('some files failed: %s' %failed)
+
+    def findRecords(self, tests = None, accept = None):
+        """Returns the logs of the given tests (all if None) whose header is
+           accepted, as a sorted list of tuples (iterationNo, scenarioNo,
+           runNo, test, path). The logs are taken from the manifest of the
+           input directory if there is one, otherwise the directory is
+           walked. With --walk the directory is walked for logs which the
+           manifest does not list, too."""
+
+        manifest = readManifest(self.args.indir)
+        if manifest is None:
+            found = self.walkRecords(tests, accept)
+        elif self.args.walk:
+            debug("Reading logs from the manifest of %s" %self.args.indir)
+            listed = set()
+            found = self.manifestRecords(manifest, tests, accept, listed)
+            found += self.walkRecords(tests, accept, listed)
+        else:
+            debug("Reading logs from the manifest of %s" %self.args.indir)
+            found = self.manifestRecords(manifest, tests, accept)
+
+        found.sort()
+        return found
+
+    def walkRecords(self, tests = None, accept = None, skip = None):
+        """Walks the input directory and returns the logs of the given tests
+           (all if None) whose header is accepted, as a list of tuples
+           (iterationNo, scenarioNo, runNo, test, path). Logs whose path
+           without compression suffix is in skip are left out."""
+
+        # testnames are only valid with plain text and numbers, logs may
+        # be compressed
+        suffixes = "|".join([re.escape(c[0]) for c in COMPRESSIONS])
+        regex = re.compile("^i(\d+)_s(\d+)_r(\d+)_test_(\w+)(?:%s)?$" % suffixes)
+        found = list()
+
         for root, dirs, files in os.walk(self.args.indir):
             debug("Processing %s" %root)
+            index = None
+            if accept:
+                index = HeaderIndex(root)
+                logs = list()
+
             for name in files:
                 entry = os.path.join(root, name)
                 match = regex.match(name)
@@ -112,24 +267,92 @@ class Analysis(Application):
                     runNo       = int(groups[2])
                     test        = groups[3]
 
+                    if index:
+                        logs.append(name)
+
+                    # already taken from the manifest
+                    if skip and os.path.normpath(
+                            os.path.join(root, name[:match.end(4)])) in skip:
+                        continue
+
                     # filter tests
                     if tests and not test in tests:
                         continue
 
-                    count += 1
-                    debug("Processing %s" %entry)
-                    record = self.factory.createRecord(entry,test)
+                    # filter by header
+                    if index and not accept(index.getHeader(name)):
+                        continue
 
-                    # call hook
-                    onLoad(record, iterationNo, scenarioNo, runNo, test)
+                    found.append((iterationNo, scenarioNo, runNo, test, entry))
 
-        if (count == 0):
-            warn('Found no log records in "%s" Stop.' %self.args.indir)
-            sys.exit(0)
-        else:
-            info('Found %d test records.' %count)
-            if failed:
-                warn('some files failed: %s' %failed)
+            if index:
+                index.prune(logs)
+                index.save()
+
+        return found
+
+    def manifestRecords(self, manifest, tests = None, accept = None,
+                        listed = None):
+        """Returns the logs listed in the manifest of the input directory
+           like walkRecords(), but filters by the headers in the manifest.
+           Neither the directory nor the logs are looked up, the paths are
+           taken as recorded, logs compressed after the test are found when
+           they are opened. If listed is given, the paths of all usable
+           entries are added to it, whether they are accepted or not."""
+
+        found = list()
+        for entry in manifest:
+            # not a log of a numbered test run
+            if entry.get("iteration") is None:
+                continue
+
+            path = os.path.join(self.args.indir, entry["path"])
+            if listed is not None:
+                listed.add(os.path.normpath(path))
+
+            # filter tests and by header
+            test = entry["test"]
+            if tests and not test in tests:
+                continue
+            if accept and not accept(entry.get("header") or dict()):
+                continue
+
+            found.append((entry["iteration"], entry["scenario"],
+                          entry["run"], test, path))
+
+        return found
+
+    def parseRecords(self, found, whats = None):
+        """Yields the given logs in order together with the marshaled state
+           of their parsed record. Logs are parsed in a pool of worker
+           processes, at most two logs per job are parsed ahead to limit the
+           memory used. With a single job nothing is parsed ahead and the
+           state is None."""
+
+        jobs = min(self.args.jobs, len(found))
+        if jobs <= 1:
+            for job in found:
+                yield (job, None)
+            return
+
+        info("Parsing records in %d processes..." %jobs)
+        pool = multiprocessing.Pool(jobs)
+        inflight = collections.deque()
+        try:
+            for job in found:
+                work = (job[4], job[3], whats)
+                inflight.append((job, pool.apply_async(_parseRecord, (work,))))
+                if len(inflight) >= 2 * jobs:
+                    (job, result) = inflight.popleft()
+                    yield (job, result.get())
+
+            while inflight:
+                (job, result) = inflight.popleft()
+                yield (job, result.get())
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
 
     def run(self):
         """Main Method"""
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vi:et:sw=4 ts=4
+
+# Copyright (C) 2013 Alexander Zimmermann <alexander.zimmermann@netapp.com>
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms and conditions of the GNU General Public License,
+# version 2, as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for
+# more details.
+
+# python imports
+import numpy
+from logging import info, debug, warn, error
+
+# statistics bootstrap() can compute
+STATISTICS = ("mean", "median")
+
+def _median(values, axis = -1):
+    """Like numpy.median(), but partitions only the middle elements."""
+
+    size = values.shape[axis]
+    middle = [(size - 1) // 2, size // 2]
+    values = numpy.partition(values, middle, axis = axis)
+    return values.take(middle, axis = axis).mean(axis = axis)
+
+def bootstrap(groups, statistics = STATISTICS, resamples = 1000,
+              confidence = 0.95, seed = 0, maxsize = 2**22):
+    """Computes percentile bootstrap confidence intervals of the given
+       statistics (mean and/or median) for every group in groups, a
+       dictionary mapping a key, e.g. (runNo, scenarioNo), to a sequence of
+       values. Groups of equal size are resampled together in batches of at
+       most maxsize values, the resamples are drawn from a random generator
+       seeded with seed, so results are reproducible.
+       Returns a dictionary mapping each key to a dictionary mapping each
+       statistic to (estimate, lower, upper).
+    """
+
+    for statistic in statistics:
+        if not statistic in STATISTICS:
+            raise ValueError("unknown statistic %s" % statistic)
+
+    functions = dict(mean = numpy.mean, median = _median)
+    random = numpy.random.RandomState(seed)
+    alpha = 100 * (1 - confidence) / 2
+
+    # groups of a sweep mostly have the same number of values, e.g. one per
+    # iteration, groups of equal size are resampled together
+    sizes = dict()
+    for key in sorted(groups):
+        if len(groups[key]):
+            sizes.setdefault(len(groups[key]), list()).append(key)
+
+    results = dict()
+    for (size, keys) in sorted(sizes.iteritems()):
+        count = max(1, maxsize // (resamples * size))
+        for first in range(0, len(keys), count):
+            batch = keys[first:first + count]
+            debug("Bootstrapping %u groups of %u values" %(len(batch), size))
+
+            values = numpy.array([groups[key] for key in batch], dtype = float)
+
+            # indices into the flattened values of the batch, drawing small
+            # integers is faster
+            dtype = numpy.uint8
+            if size > 255:
+                dtype = numpy.intp
+            indices = random.randint(0, size, (len(batch), resamples, size),
+                                     dtype = dtype)
+            offsets = numpy.arange(0, len(batch) * size, size)
+            samples = values.take(indices + offsets[:, None, None])
+
+            for statistic in statistics:
+                estimates = functions[statistic](values, axis = -1)
+                replicates = functions[statistic](samples, axis = -1)
+                (lower, upper) = numpy.percentile(replicates,
+                                                  [alpha, 100 - alpha], axis = 1)
+                for (row, key) in enumerate(batch):
+                    results.setdefault(key, dict())[statistic] = \
+                            (estimates[row], lower[row], upper[row])
+
+    return results
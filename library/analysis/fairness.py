@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vi:et:sw=4 ts=4
+
+# Copyright (C) 2013 Alexander Zimmermann <alexander.zimmermann@netapp.com>
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms and conditions of the GNU General Public License,
+# version 2, as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for
+# more details.
+
+# python imports
+import numpy
+from logging import info, debug, warn, error
+
+def nanMean(values, axis):
+    """Mean of values along axis leaving out NaN, NaN if all are."""
+
+    active = ~numpy.isnan(values)
+    count = active.sum(axis = axis)
+    total = numpy.where(active, values, 0).sum(axis = axis)
+
+    means = numpy.empty(numpy.shape(total))
+    means.fill(numpy.nan)
+    means[count > 0] = total[count > 0] / count[count > 0]
+    return means
+
+def jainIndex(values, axis = 0):
+    """Jain's fairness index of values along axis, e.g. over the flows. NaN
+       values, e.g. of flows which are not active, are left out. The index
+       is 1 if all values are equal, 1/n if only one of n is non-zero and
+       NaN if all are zero or NaN."""
+
+    values = numpy.asarray(values, dtype = float)
+    active = ~numpy.isnan(values)
+    values = numpy.where(active, values, 0)
+
+    count = active.sum(axis = axis)
+    total = values.sum(axis = axis)
+    squares = (values * values).sum(axis = axis)
+
+    index = numpy.empty(numpy.shape(total))
+    index.fill(numpy.nan)
+    positive = squares > 0
+    index[positive] = total[positive]**2 / (count[positive] * squares[positive])
+    return index
+
+def alignFlows(flows, interval, column = "tput", direction = "S"):
+    """Aligns the interval values of column of concurrent flows (as returned
+       by the flows of a FlowgrindRecord) in direction. Returns a matrix
+       with one row per flow and one column per reporting interval, which
+       holds the value of the interval of the flow ending in it, or NaN if
+       the flow has none."""
+
+    slots = list()
+    for flow in flows:
+        ends = flow[direction]['end']
+        slots.append(numpy.rint(ends / interval).astype(int) - 1)
+
+    length = max([slot.max() + 1 for slot in slots if len(slot)] or [0])
+    matrix = numpy.empty((len(flows), length))
+    matrix.fill(numpy.nan)
+    for (row, (flow, slot)) in enumerate(zip(flows, slots)):
+        matrix[row, slot] = flow[direction][column]
+    return matrix
+
+def windowMeans(matrix, size):
+    """Averages the columns of matrix, e.g. returned by alignFlows(), in
+       windows of size columns, leaving out NaN values. A window without
+       any value of a row is NaN."""
+
+    matrix = numpy.asarray(matrix, dtype = float)
+    (rows, columns) = matrix.shape
+    windows = -(-columns // size)
+
+    # pad to whole windows
+    padded = numpy.empty((rows, windows * size))
+    padded.fill(numpy.nan)
+    padded[:, :columns] = matrix
+    return nanMean(padded.reshape(rows, windows, size), axis = 2)
+
+def stack(matrices):
+    """Stacks matrices with a row per flow, e.g. of several records, into
+       one array with the matrices along the first axis. Smaller matrices
+       are padded with NaN, i.e. missing flows and intervals."""
+
+    if not matrices:
+        return numpy.empty((0, 0, 0))
+    rows = max([matrix.shape[0] for matrix in matrices])
+    columns = max([matrix.shape[1] for matrix in matrices])
+
+    stacked = numpy.empty((len(matrices), rows, columns))
+    stacked.fill(numpy.nan)
+    for (i, matrix) in enumerate(matrices):
+        stacked[i, :matrix.shape[0], :matrix.shape[1]] = matrix
+    return stacked
+
+def fairnessOverTime(matrices):
+    """Jain's index over the flows of every column of matrices (see
+       stack()), e.g. window means of several records. Returns an array
+       with a row per matrix and a column per window."""
+
+    return jainIndex(stack(matrices), axis = 1)
+
+def overallFairness(matrices):
+    """Jain's index over the mean values of the flows of every matrix, e.g.
+       of the aligned intervals of several records. Returns an array with
+       one index per matrix."""
+
+    return jainIndex(nanMean(stack(matrices), axis = 2), axis = 1)
@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vi:et:sw=4 ts=4
+
+# Copyright (C) 2013 Alexander Zimmermann <alexander.zimmermann@netapp.com>
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms and conditions of the GNU General Public License,
+# version 2, as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for
+# more details.
+
+# python imports
+import re
+from logging import info, debug, warn, error
+
+# tcp-eval imports
+from recordsink import RecordSink
+from ledger import IngestLedger
+
+# tests whose logs are loaded into the database
+FLOWGRIND_TESTS = ["flowgrind", "multiflowgrind"]
+
+# summary values of a test and the type of their column
+SUMMARY = [("thruput", "DOUBLE"),
+           ("thruput_recv", "DOUBLE"),
+           ("rtt_min", "DOUBLE"),
+           ("rtt_avg", "DOUBLE"),
+           ("rtt_max", "DOUBLE"),
+           ("total_retransmits", "INTEGER"),
+           ("total_fast_retransmits", "INTEGER"),
+           ("total_rto_retransmits", "INTEGER")]
+
+# summary values of a flow, the list they are taken from and their type
+FLOW_SUMMARY = [("thruput", "thruput_list", "DOUBLE"),
+                ("thruput_recv", "thruput_recv_list", "DOUBLE"),
+                ("rtt_min", "rtt_min_list", "DOUBLE"),
+                ("rtt_avg", "rtt_avg_list", "DOUBLE"),
+                ("rtt_max", "rtt_max_list", "DOUBLE")]
+
+# header keys which can be used as column names
+COLUMN = re.compile("^[A-Za-z_]\w*$")
+
+def requireHeaders(*keys):
+    """Returns a filter for FlowgrindDatabase.ingest() which accepts the
+       logs whose header has all the given keys."""
+
+    def accept(header):
+        for key in keys:
+            if not key in header:
+                return False
+        return True
+    return accept
+
+def convert(value):
+    """Converts a header value to an int or float if it is one."""
+
+    for type in (int, float):
+        try:
+            return type(value)
+        except ValueError:
+            pass
+    return value
+
+class FlowgrindDatabase:
+    """Canonical database of the flowgrind tests of a sweep.
+       The table records has one row per test with iterationNo, scenarioNo,
+       runNo and test, a typed column for every header key found in the
+       logs and the summary values of the test. The table flows has the
+       summary values of every flow. Logs are loaded once, ingest() only
+       loads new or changed logs. Analyses query these tables, usually
+       through a view with the columns they expect.
+    """
+
+    def __init__(self, analysis, filename = "flowgrind.sqlite"):
+        self.analysis = analysis
+        self.dbcon = analysis.connect(filename)
+        self.sink = RecordSink(self.dbcon)
+
+        self.dbcon.execute("""
+        CREATE TABLE IF NOT EXISTS records (iterationNo INTEGER,
+                                            scenarioNo  INTEGER,
+                                            runNo       INTEGER,
+                                            test        VARCHAR(50),
+                                            flow_count  INTEGER,
+                                            %s)
+        """ % ",\n".join(["%s %s" % column for column in SUMMARY]))
+        self.dbcon.execute("""
+        CREATE TABLE IF NOT EXISTS flows (iterationNo INTEGER,
+                                          scenarioNo  INTEGER,
+                                          runNo       INTEGER,
+                                          test        VARCHAR(50),
+                                          flowNo      INTEGER,
+                                          %s)
+        """ % ",\n".join(["%s %s" % (name, sqltype)
+                          for (name, what, sqltype) in FLOW_SUMMARY]))
+
+        # columns of records in table order
+        self.columns = [row[1] for row in
+                        self.dbcon.execute("PRAGMA table_info(records)")]
+
+    def ingest(self, filter = None):
+        """Loads all new or changed flowgrind logs of the input directory.
+           If filter is set, only logs whose header it accepts are loaded,
+           see Analysis.loadRecords(). The other logs are left for a later
+           ingest() which accepts them."""
+
+        ledger = IngestLedger(self.sink, ["records", "flows"])
+        whats = [name for (name, sqltype) in SUMMARY] + ["flow_ids"] + \
+                [what for (name, what, sqltype) in FLOW_SUMMARY]
+        self.analysis.loadRecords(onLoad = self.onLoad, tests = FLOWGRIND_TESTS,
+                                  filter = filter, whats = whats, ledger = ledger)
+        self.sink.flush()
+        self.dbcon.commit()
+
+    def addColumn(self, name, type = ""):
+        """Adds a column for a header key to records if there is none."""
+
+        if name.lower() in [column.lower() for column in self.columns]:
+            return
+
+        # buffered rows do not have the new column
+        self.sink.flush()
+        debug("Adding column %s %s to records" %(name, type))
+        self.dbcon.execute('ALTER TABLE records ADD COLUMN "%s" %s' %(name, type))
+        self.columns.append(name)
+
+    def requireColumns(self, *names):
+        """Makes sure records has the given columns, e.g. for header keys a
+           view uses, which are not in any log loaded so far."""
+
+        for name in names:
+            self.addColumn(name)
+
+    def onLoad(self, record, iterationNo, scenarioNo, runNo, test):
+        values = dict(iterationNo = iterationNo, scenarioNo = scenarioNo,
+                      runNo = runNo, test = test)
+
+        for (key, value) in record.getHeader().iteritems():
+            if not COLUMN.match(key) or key in values:
+                debug("%s: ignoring header key %s" %(record.filename, key))
+                continue
+            value = convert(value)
+            if isinstance(value, int):
+                self.addColumn(key, "INTEGER")
+            elif isinstance(value, float):
+                self.addColumn(key, "DOUBLE")
+            else:
+                self.addColumn(key, "TEXT")
+            values[key] = value
+
+        for (name, sqltype) in SUMMARY:
+            values[name] = record.calculate(name, optional = True)
+        values["flow_count"] = len(record.calculate("flow_ids", optional = True) or [])
+
+        self.sink.insert("records", *[values.get(column) for column in self.columns])
+
+        # per flow values
+        lists = [record.calculate(what, optional = True) or []
+                 for (name, what, sqltype) in FLOW_SUMMARY]
+        for flowNo in range(max(map(len, lists))):
+            row = [iterationNo, scenarioNo, runNo, test, flowNo]
+            for flow_values in lists:
+                if flowNo < len(flow_values):
+                    row.append(flow_values[flowNo])
+                else:
+                    row.append(None)
+            self.sink.insert("flows", *row)
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vi:et:sw=4 ts=4
+
+# Copyright (C) 2013 Alexander Zimmermann <alexander.zimmermann@netapp.com>
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms and conditions of the GNU General Public License,
+# version 2, as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for
+# more details.
+
+# python imports
+import os
+import os.path
+import marshal
+from logging import info, debug, warn, error
+
+# tcp-eval imports
+from testrecord import readHeader
+
+class HeaderIndex:
+    """Index of the headers of the test logs in one directory.
+       It maps every log to its size, mtime and header and is kept in the
+       hidden file .headerindex of the directory. Only logs which are new
+       or changed since the index was written are opened to read their
+       header, so records can be filtered by header without opening them.
+    """
+
+    # bump if the layout of the index changes
+    version = 1
+
+    def __init__(self, directory):
+        self.filename = os.path.join(directory, ".headerindex")
+        self.directory = directory
+        self.entries = dict()
+        self.dirty = False
+
+        try:
+            fh = open(self.filename, "rb")
+            try:
+                data = marshal.load(fh)
+            finally:
+                fh.close()
+            if data['version'] == self.version:
+                self.entries = data['entries']
+        except (IOError, OSError, EOFError, ValueError, TypeError, KeyError):
+            debug("%s: no usable header index, building it" % directory)
+
+    def getHeader(self, name):
+        """Returns the header of the log name as a dictionary."""
+
+        stat = os.stat(os.path.join(self.directory, name))
+        try:
+            (size, mtime, header) = self.entries[name]
+            if size == stat.st_size and mtime == stat.st_mtime:
+                return header
+        except KeyError:
+            pass
+
+        (header, offset) = readHeader(os.path.join(self.directory, name))
+        self.entries[name] = (stat.st_size, stat.st_mtime, header)
+        self.dirty = True
+        return header
+
+    def prune(self, names):
+        """Drops all logs from the index which are not in names."""
+
+        for name in set(self.entries).difference(names):
+            del self.entries[name]
+            self.dirty = True
+
+    def save(self):
+        """Writes the index if it was changed."""
+
+        if not self.dirty:
+            return
+
+        tmpname = "%s.%u" % (self.filename, os.getpid())
+        try:
+            fh = open(tmpname, "wb")
+            try:
+                marshal.dump(dict(version = self.version,
+                                  entries = self.entries), fh)
+            finally:
+                fh.close()
+            os.rename(tmpname, self.filename)
+            self.dirty = False
+        except (IOError, OSError), inst:
+            debug("%s: failed to write header index: %s" % (self.directory, inst))
@@ -0,0 +1,209 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vi:et:sw=4 ts=4
+
+# Copyright (C) 2013 Alexander Zimmermann <alexander.zimmermann@netapp.com>
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms and conditions of the GNU General Public License,
+# version 2, as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for
+# more details.
+
+# python imports
+import os
+import os.path
+import marshal
+import numpy
+from logging import info, debug, warn, error
+
+# layout of the archive
+ARCHIVE_VERSION = 1
+INDEX = "index"
+
+# types of the interval columns in the archive
+DTYPES = { float : numpy.dtype("<f8"),
+           int   : numpy.dtype("<i8"),
+           str   : numpy.dtype("S16") }
+
+# value of an optional column a log does not have
+MISSING = { float : numpy.nan,
+            int   : -1,
+            str   : "" }
+
+class IntervalArchiveWriter:
+    """Writes the interval rows of flowgrind logs into a columnar archive.
+       The archive is a directory with one raw file per column, which can
+       be memory mapped, and an index. The rows of every flow and direction
+       of a log are written as one chunk, keyed by (iteration, scenario,
+       run, flow, direction). The archive is replaced, it is complete once
+       close() has written the index.
+    """
+
+    def __init__(self, directory, columns):
+        """columns maps the column names to their type (float, int or str)
+           like the keys of the FlowgrindRecordFactory."""
+
+        self.directory = directory
+        self.columns = columns
+        self.chunks = list()
+        self.rows = 0
+
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+        # the index is written last, an archive without is incomplete
+        index = os.path.join(directory, INDEX)
+        if os.path.exists(index):
+            os.remove(index)
+
+        self.files = dict()
+        for column in columns:
+            self.files[column] = open(os.path.join(directory, column), "wb")
+
+    def add(self, key, flow, filename = None):
+        """Adds the rows of flow (a StrictStruct of columns as returned by
+           the flows of a FlowgrindRecord) with the given key."""
+
+        for (column, type) in self.columns.iteritems():
+            values = flow[column]
+            if len(values) != flow.size:
+                values = numpy.empty(flow.size, dtype = DTYPES[type])
+                values.fill(MISSING[type])
+            numpy.asarray(values, dtype = DTYPES[type]).tofile(self.files[column])
+
+        self.chunks.append((tuple(key), self.rows, flow.size, filename))
+        self.rows += flow.size
+
+    def addRecord(self, record, iterationNo, scenarioNo, runNo):
+        """Adds all flows of a FlowgrindRecord."""
+
+        flows = record.calculate("flows")
+        if not flows:
+            return
+
+        flow_ids = sorted(record.calculate("flow_ids"))
+        for (flowNo, flow) in zip(flow_ids, flows):
+            for direction in ('S', 'D'):
+                self.add((iterationNo, scenarioNo, runNo, flowNo, direction),
+                         flow[direction], record.filename)
+
+    def close(self):
+        """Closes the column files and writes the index."""
+
+        for fh in self.files.itervalues():
+            fh.close()
+
+        columns = dict([(column, DTYPES[type].str)
+                        for (column, type) in self.columns.iteritems()])
+        index = dict(version = ARCHIVE_VERSION, columns = columns,
+                     chunks = self.chunks, rows = self.rows)
+
+        filename = os.path.join(self.directory, INDEX)
+        fh = open(filename + ".tmp", "wb")
+        try:
+            marshal.dump(index, fh)
+        finally:
+            fh.close()
+        os.rename(filename + ".tmp", filename)
+        info("Wrote %u intervals in %u chunks to %s"
+                %(self.rows, len(self.chunks), self.directory))
+
+
+class IntervalArchive:
+    """Reads a columnar archive written by IntervalArchiveWriter. Columns
+       are memory mapped when they are first used, so reading a few columns
+       of a few chunks only touches these.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+        fh = open(os.path.join(directory, INDEX), "rb")
+        try:
+            index = marshal.load(fh)
+        finally:
+            fh.close()
+
+        if index['version'] != ARCHIVE_VERSION:
+            raise ValueError("%s: unsupported archive version %s"
+                    %(directory, index['version']))
+
+        self.dtypes = dict([(column, numpy.dtype(dtype))
+                            for (column, dtype) in index['columns'].iteritems()])
+        self.rows = index['rows']
+
+        # a later chunk with the same key replaces an earlier one
+        self.chunks = dict()
+        self.filenames = dict()
+        for (key, start, size, filename) in index['chunks']:
+            self.chunks[tuple(key)] = (start, size)
+            self.filenames[tuple(key)] = filename
+
+        self.maps = dict()
+
+    def getColumns(self):
+        """Returns the names of the columns in the archive."""
+        return sorted(self.dtypes)
+
+    def getColumn(self, column):
+        """Returns the whole column as a (memory mapped) array."""
+
+        try:
+            return self.maps[column]
+        except KeyError:
+            pass
+
+        dtype = self.dtypes[column]
+        if self.rows:
+            values = numpy.memmap(os.path.join(self.directory, column),
+                                  dtype = dtype, mode = "r", shape = (self.rows,))
+        else:
+            values = numpy.empty(0, dtype = dtype)
+        self.maps[column] = values
+        return values
+
+    def keys(self, iteration = None, scenario = None, run = None,
+             flow = None, direction = None, filename = None):
+        """Returns the sorted keys of the chunks matching the given values,
+           None matches all. filename matches the log the chunks were read
+           from by its base name."""
+
+        wanted = (iteration, scenario, run, flow, direction)
+        if filename is not None:
+            filename = os.path.basename(filename)
+        return sorted([key for key in self.chunks
+                       if all([w is None or w == k for (w, k) in zip(wanted, key)])
+                       and (filename is None or filename ==
+                            os.path.basename(self.filenames[key] or ""))])
+
+    def read(self, key, columns = None, start = None, end = None):
+        """Returns a dictionary with the columns (all if None) of the chunk
+           key. If start or end are given, only the intervals beginning in
+           [start, end) are returned."""
+
+        (first, size) = self.chunks[tuple(key)]
+        (lower, upper) = (0, size)
+
+        # intervals of a chunk are ordered by their begin
+        if start is not None or end is not None:
+            begin = self.getColumn("begin")[first:first + size]
+            if start is not None:
+                lower = numpy.searchsorted(begin, start, "left")
+            if end is not None:
+                upper = max(numpy.searchsorted(begin, end, "left"), lower)
+
+        if columns is None:
+            columns = self.getColumns()
+        return dict([(column, self.getColumn(column)[first + lower:first + upper])
+                     for column in columns])
+
+    def select(self, columns = None, start = None, end = None, **match):
+        """Yields (key, columns) for every chunk matching the key values in
+           match (see keys()), like read()."""
+
+        for key in self.keys(**match):
+            yield (key, self.read(key, columns, start, end))
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vi:et:sw=4 ts=4
+
+# Copyright (C) 2013 Alexander Zimmermann <alexander.zimmermann@netapp.com>
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms and conditions of the GNU General Public License,
+# version 2, as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for
+# more details.
+
+# python imports
+import os
+import os.path
+from logging import info, debug, warn, error
+
+# tcp-eval imports
+from testrecord import compressedLog
+
+class IngestLedger:
+    """Ledger of the test logs loaded into a persistent analysis database.
+       For every log it records path, size, mtime and parser version
+       together with iteration, scenario, run and test, which identify the
+       rows of the log in the given tables. The ledger is written through
+       the RecordSink of the database as the last row of a log, so it is
+       committed together with the rows. Pass it to Analysis.loadRecords()
+       to load only new or changed logs, the rows of changed and deleted
+       logs are dropped.
+    """
+
+    def __init__(self, sink, tables):
+        self.sink = sink
+        self.dbcon = sink.dbcon
+        self.tables = tables
+        self.current = 0
+        self.stats = dict()
+
+        exists = self.dbcon.execute("""
+            SELECT count(*) FROM sqlite_master
+            WHERE type='table' AND name='ingested'""").fetchone()[0]
+        if exists:
+            return
+
+        # rows of a database without ledger can not be assigned to logs
+        with self.dbcon:
+            deleted = 0
+            for table in self.tables:
+                deleted += self.dbcon.execute("DELETE FROM %s" % table).rowcount
+            if deleted:
+                info("Database has no ingestion ledger, reloading all records.")
+            self.dbcon.execute("""
+            CREATE TABLE ingested (path        TEXT PRIMARY KEY,
+                                   size        INTEGER,
+                                   mtime       DOUBLE,
+                                   version     VARCHAR(32),
+                                   iterationNo INTEGER,
+                                   scenarioNo  INTEGER,
+                                   runNo       INTEGER,
+                                   test        VARCHAR(50))
+            """)
+
+    def select(self, found, getVersion):
+        """Takes the list of (iterationNo, scenarioNo, runNo, test, path)
+           found by loadRecords() and returns the ones which have to be
+           loaded. getVersion is called with a test and returns the version
+           of its parser. Rows of logs which changed or disappeared are
+           dropped, logs which were not found only because of a filter are
+           kept. Logs which do not exist are replaced by their compressed
+           log or left out."""
+
+        versions = dict()
+        existing = list()
+        for job in found:
+            (iterationNo, scenarioNo, runNo, test, path) = job
+            if not test in versions:
+                versions[test] = getVersion(test)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                path = compressedLog(path)
+                if path is None:
+                    debug("%s does not exist" %job[4])
+                    continue
+                job = job[:4] + (path,)
+                stat = os.stat(path)
+            self.stats[os.path.abspath(path)] = (stat.st_size, stat.st_mtime,
+                                                 versions[test], job[:4])
+            existing.append(job)
+        found = existing
+
+        # logs whose rows have to be dropped
+        stale = set()
+        ingested = set()
+        for row in self.dbcon.execute("SELECT * FROM ingested"):
+            (path, size, mtime, version) = row[:4]
+            try:
+                if self.stats[path][:3] == (size, mtime, version):
+                    ingested.add(path)
+                    continue
+            except KeyError:
+                if os.path.exists(path):
+                    continue
+            stale.add(tuple(row[4:]))
+
+        # logs sharing the rows of a stale one are loaded again, too
+        if stale:
+            info("Dropping rows of %u changed or deleted test records." % len(stale))
+            with self.dbcon:
+                for table in self.tables:
+                    self.dbcon.executemany("""
+                        DELETE FROM %s WHERE iterationNo=? AND scenarioNo=?
+                        AND runNo=? AND test=?""" % table, stale)
+                self.dbcon.executemany("""
+                    DELETE FROM ingested WHERE iterationNo=? AND scenarioNo=?
+                    AND runNo=? AND test=?""", stale)
+            ingested = set(row[0] for row in
+                           self.dbcon.execute("SELECT path FROM ingested"))
+
+        selected = [job for job in found
+                    if not os.path.abspath(job[4]) in ingested]
+        self.current = len(found) - len(selected)
+        return selected
+
+    def add(self, path):
+        """Records that the log path selected before has been loaded."""
+
+        path = os.path.abspath(path)
+        (size, mtime, version, key) = self.stats[path]
+        self.sink.insert("ingested", path, size, mtime, version, *key)
+        self.sink.endRecord()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vi:et:sw=4 ts=4
+
+# Copyright (C) 2013 Alexander Zimmermann <alexander.zimmermann@netapp.com>
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms and conditions of the GNU General Public License,
+# version 2, as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for
+# more details.
+
+# python imports
+import re
+from logging import info, debug, warn, error
+
+# tcp-eval imports
+from testrecord import LogFile, compressedLog
+
+# problems a validation reports, all but failed are found by validateLog()
+CHECKS = ["failed",         # the test exited with an error (from the manifest)
+          "unreadable",     # the log can not be read
+          "no_begin",       # the log has no BEGIN_TEST_OUTPUT
+          "no_intervals",   # the log has no interval rows
+          "truncated",      # interval rows or the last line are cut off
+          "no_summary",     # a flow has no summary lines
+          "zero_thruput",   # a flow has a throughput of zero
+          "long_setup"]     # a flow took long to send its first data
+
+# summary line of a flow, " 0 S: ..." or "# ID 0 S: ..." in newer versions
+SUMMARY = re.compile("^(?:# ID)?\s*(\d+) ([SRD]): .*?through = (\d+\.\d+)")
+
+def validateLog(filename, setup = 1.0):
+    """Checks a flowgrind log for the problems listed in CHECKS without
+       parsing it into a record. A connection setup is long if the first
+       interval with a non-zero throughput ends after setup seconds.
+       Returns a dictionary with the number of flows and intervals of the
+       log and the list of problems, each a dictionary with check, flow
+       (None for the whole log) and detail."""
+
+    problems = list()
+    report = dict(flows = 0, intervals = 0, problems = problems)
+    def problem(check, detail, flow = None):
+        problems.append(dict(check = check, flow = flow, detail = detail))
+
+    try:
+        try:
+            fh = LogFile(filename)
+        except IOError:
+            # the log may have been compressed after the test
+            compressed = compressedLog(filename)
+            if compressed is None:
+                raise
+            fh = LogFile(compressed)
+        try:
+            content = fh.read()
+        finally:
+            fh.close()
+    except (IOError, OSError), inst:
+        problem("unreadable", str(inst))
+        return report
+
+    begin = content.find("BEGIN_TEST_OUTPUT")
+    if begin < 0:
+        problem("no_begin", "no BEGIN_TEST_OUTPUT")
+        return report
+    if not content.endswith("\n"):
+        problem("truncated", "last line is incomplete")
+
+    # per flow and direction: rows, columns of the first row, end of the
+    # first interval with a throughput and the last row
+    intervals = dict()
+    # per flow and direction: throughput of the summary
+    summaries = dict()
+
+    lines = content[begin:].split("\n")[1:]
+    for line in lines:
+        if line[:2] in ("S ", "R ", "D "):
+            # only the leading columns are needed
+            fields = line.split(None, 5)
+            try:
+                key = (int(fields[1]), fields[0])
+                end = float(fields[3])
+                tput = float(fields[4])
+            except (IndexError, ValueError):
+                problem("truncated", "malformed interval row: %s" % line.strip())
+                continue
+
+            state = intervals.get(key)
+            if state is None:
+                state = intervals[key] = [0, len(line.split()), None, line]
+            state[0] += 1
+            state[3] = line
+            if state[2] is None and tput > 0:
+                state[2] = end
+            continue
+
+        match = SUMMARY.match(line)
+        if match:
+            (flow, direction, tput) = match.groups()
+            summaries[(int(flow), direction)] = float(tput)
+
+    flows = sorted(set([key[0] for key in intervals] + [key[0] for key in summaries]))
+    report["flows"] = len(flows)
+    report["intervals"] = sum([state[0] for state in intervals.itervalues()])
+    if not intervals:
+        problem("no_intervals", "no interval rows")
+
+    # logs are cut off at the end, so only the last rows can be short
+    for ((flow, direction), state) in sorted(intervals.iteritems()):
+        columns = len(state[3].split())
+        if columns < state[1]:
+            problem("truncated", "interval row has %u of %u columns: %s"
+                    %(columns, state[1], state[3].strip()), flow)
+
+    for flow in flows:
+        sender = intervals.get((flow, "S"))
+        receiver = intervals.get((flow, "D")) or intervals.get((flow, "R"))
+        if sender and receiver and sender[0] != receiver[0]:
+            problem("truncated", "%u sender and %u receiver intervals"
+                    %(sender[0], receiver[0]), flow)
+
+        out = summaries.get((flow, "S"))
+        recv = summaries.get((flow, "D"), summaries.get((flow, "R")))
+        missing = [name for (name, value) in (("sender", out), ("receiver", recv))
+                   if value is None]
+        if missing:
+            problem("no_summary", "no %s summary" % " and ".join(missing), flow)
+        if out == 0 or recv == 0 or (sender and sender[2] is None):
+            problem("zero_thruput", "throughput %s/%s Mbit/s (sender/receiver)"
+                    %(out, recv), flow)
+        elif sender and sender[2] > setup:
+            problem("long_setup", "first data after %.3fs" % sender[2], flow)
+
+    return report
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vi:et:sw=4 ts=4
+
+# Copyright (C) 2013 Alexander Zimmermann <alexander.zimmermann@netapp.com>
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms and conditions of the GNU General Public License,
+# version 2, as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for
+# more details.
+
+# python imports
+import numpy
+from logging import info, debug, warn, error
+
+# tcp-eval imports
+from sketch import QuantileSketch
+
+class PingStats:
+    """Streaming statistics of ping tests, e.g. of a pair of nodes: packets
+       sent and received, minimum, maximum and mean RTT, a QuantileSketch of
+       the RTTs and a histogram of the lengths of bursts of lost packets.
+       Bursts of maxburst or more packets are counted in the last bin. The
+       memory does not grow with the number of pings, statistics of several
+       tests are combined by add() or merge().
+    """
+
+    def __init__(self, maxburst = 64, **sketch):
+        self.sent = 0
+        self.received = 0
+        self.min = None
+        self.max = None
+        self.sum = 0.0
+        self.count = 0
+        self.sketch = QuantileSketch(**sketch)
+        self.bursts = numpy.zeros(maxburst + 1, dtype = numpy.int64)
+
+    def add(self, rtts, seqs, sent, first = 0):
+        """Adds the results of a ping test: the RTTs of the received packets
+           and their sequence numbers as returned by the ping and fping
+           records, and the number of packets sent, whose sequence numbers
+           start at first."""
+
+        rtts = numpy.asarray(rtts, dtype = float)
+        seqs = numpy.unique(numpy.asarray(seqs, dtype = int))
+        seqs = seqs[(seqs >= first) & (seqs < first + sent)]
+
+        self.sent += sent
+        self.received += len(seqs)
+        if len(rtts):
+            self.count += len(rtts)
+            self.sum += rtts.sum()
+            self.extend(rtts.min(), rtts.max())
+            self.sketch.add(rtts)
+
+        # lost packets between the received ones, before the first and after
+        # the last one
+        bounds = numpy.concatenate(([first - 1], seqs, [first + sent]))
+        gaps = numpy.diff(bounds) - 1
+        gaps = gaps[gaps > 0]
+        self.bursts += numpy.bincount(numpy.minimum(gaps, len(self.bursts) - 1),
+                                      minlength = len(self.bursts))
+
+    def extend(self, minimum, maximum):
+        """Extends the range of RTTs seen."""
+
+        if self.min is None or minimum < self.min:
+            self.min = float(minimum)
+        if self.max is None or maximum > self.max:
+            self.max = float(maximum)
+
+    def merge(self, other):
+        """Adds the statistics of other."""
+
+        self.sent += other.sent
+        self.received += other.received
+        self.count += other.count
+        self.sum += other.sum
+        if other.count:
+            self.extend(other.min, other.max)
+        self.sketch.merge(other.sketch)
+        self.bursts += other.bursts
+
+    def loss(self):
+        """Returns the fraction of packets lost."""
+
+        if not self.sent:
+            return None
+        return 1 - float(self.received) / self.sent
+
+    def mean(self):
+        """Returns the mean RTT."""
+
+        if not self.count:
+            return None
+        return self.sum / self.count
@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vi:et:sw=4 ts=4
+
+# Copyright (C) 2013 Alexander Zimmermann <alexander.zimmermann@netapp.com>
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms and conditions of the GNU General Public License,
+# version 2, as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for
+# more details.
+
+# python imports
+from logging import info, debug, warn, error
+
+class RecordSink:
+    """Collects the rows of an analysis database.
+       Rows are buffered per table and inserted with executemany() and bound
+       parameters. Call endRecord() once all rows of a record are added,
+       if a table has batchsize rows then, the rows of all tables are
+       inserted in one transaction, so the rows of a record are committed
+       together. Values are passed as they are, None is stored as NULL.
+       Call flush() once all records are loaded.
+    """
+
+    def __init__(self, dbcon, batchsize = 1000):
+        self.dbcon = dbcon
+        self.batchsize = batchsize
+        self.rows = dict()
+
+    def insert(self, table, *values):
+        """Adds a row with the given values to table."""
+
+        try:
+            rows = self.rows[table]
+        except KeyError:
+            rows = self.rows[table] = list()
+
+        rows.append(values)
+
+    def endRecord(self):
+        """Marks the end of the rows of a record, flushes once a table has
+           batchsize rows."""
+
+        for rows in self.rows.itervalues():
+            if len(rows) >= self.batchsize:
+                self.flush()
+                break
+
+    def flush(self):
+        """Inserts the buffered rows of all tables in one transaction."""
+
+        with self.dbcon:
+            for (table, rows) in self.rows.iteritems():
+                debug("Inserting %u rows into %s" %(len(rows), table))
+                statement = "INSERT INTO %s VALUES (%s)" \
+                        %(table, ", ".join(["?"] * len(rows[0])))
+                self.dbcon.executemany(statement, rows)
+        self.rows.clear()
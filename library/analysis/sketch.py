@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vi:et:sw=4 ts=4
+
+# Copyright (C) 2013 Alexander Zimmermann <alexander.zimmermann@netapp.com>
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms and conditions of the GNU General Public License,
+# version 2, as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for
+# more details.
+
+# python imports
+import math
+import marshal
+import numpy
+from logging import info, debug, warn, error
+
+# version of the serialized sketches
+SKETCH_VERSION = 1
+
+class QuantileSketch:
+    """Mergeable sketch of the distribution of positive values. Values are
+       counted in buckets whose bounds grow by the factor gamma = (1 +
+       accuracy) / (1 - accuracy) from minimum to maximum, so quantiles have
+       a relative error of at most accuracy and the memory is fixed. Values
+       outside of [minimum, maximum] are counted in the first or last
+       bucket. Sum and sum of squares are kept exactly for mean() and std().
+       Sketches with the same parameters can be merged.
+    """
+
+    def __init__(self, accuracy = 0.01, minimum = 1e-3, maximum = 1e5):
+        self.accuracy = accuracy
+        self.minimum = minimum
+        self.maximum = maximum
+        self.gamma = (1 + accuracy) / (1 - accuracy)
+        self.sum = 0.0
+        self.squares = 0.0
+
+        # bucket i holds the values in (gamma^(i+offset-1), gamma^(i+offset)]
+        self.offset = int(math.floor(math.log(minimum, self.gamma)))
+        size = int(math.ceil(math.log(maximum, self.gamma))) - self.offset + 1
+        self.counts = numpy.zeros(size, dtype = numpy.int64)
+
+    def add(self, values):
+        """Adds the given values."""
+
+        values = numpy.asarray(values, dtype = float).ravel()
+        if not len(values):
+            return
+        self.sum += values.sum()
+        self.squares += numpy.dot(values, values)
+
+        values = numpy.clip(values, self.minimum, self.maximum)
+        indices = numpy.ceil(numpy.log(values) / math.log(self.gamma)).astype(int)
+        self.counts += numpy.bincount(indices - self.offset,
+                                      minlength = len(self.counts))
+
+    def merge(self, other):
+        """Adds the values of another sketch."""
+
+        if (self.gamma, self.offset, len(self.counts)) != \
+                (other.gamma, other.offset, len(other.counts)):
+            raise ValueError("sketches with different parameters can not be merged")
+        self.counts += other.counts
+        self.sum += other.sum
+        self.squares += other.squares
+
+    def count(self):
+        """Returns the number of values."""
+        return int(self.counts.sum())
+
+    def mean(self):
+        """Returns the mean of the values, or None if there are none."""
+
+        count = self.count()
+        if not count:
+            return None
+        return self.sum / count
+
+    def std(self):
+        """Returns the standard deviation of the values, or None if there
+           are none."""
+
+        count = self.count()
+        if not count:
+            return None
+        return math.sqrt(max(self.squares / count - (self.sum / count)**2, 0))
+
+    def values(self):
+        """Returns the value each bucket stands for, the one with the
+           smallest relative error to its bounds."""
+
+        exponents = numpy.arange(len(self.counts)) + self.offset
+        return 2 * self.gamma ** exponents / (self.gamma + 1)
+
+    def quantiles(self, qs):
+        """Returns the q-quantiles of the values for the given qs between 0
+           and 1 as an array, or None if there are no values."""
+
+        total = self.counts.sum()
+        if not total:
+            return None
+        ranks = numpy.asarray(qs, dtype = float) * (total - 1)
+        indices = numpy.searchsorted(numpy.cumsum(self.counts), ranks, "right")
+        return self.values()[indices]
+
+    def quantile(self, q):
+        """Returns the q-quantile of the values, see quantiles()."""
+
+        values = self.quantiles([q])
+        if values is None:
+            return None
+        return float(values[0])
+
+    def cdf(self):
+        """Returns the upper bounds of the non-empty buckets and the fraction
+           of values up to each bound as two arrays. The complementary CDF
+           is one minus the fractions."""
+
+        used = numpy.flatnonzero(self.counts)
+        if not len(used):
+            return (numpy.empty(0), numpy.empty(0))
+        bounds = self.gamma ** (used + self.offset)
+        fractions = numpy.cumsum(self.counts[used]) / float(self.counts.sum())
+        return (bounds, fractions)
+
+    def histogram(self, bins = 10, range = None, density = False):
+        """Returns a histogram of the values like numpy.histogram() with
+           bins equal-width bins over range, by default the bounds of the
+           non-empty buckets. The values of a bucket are assumed to be
+           spread evenly between its bounds."""
+
+        used = numpy.flatnonzero(self.counts)
+        if not len(used):
+            return (numpy.zeros(bins), numpy.linspace(0, 1, bins + 1))
+
+        # number of values up to the bounds of the buckets
+        bounds = self.gamma ** (numpy.arange(len(self.counts) + 1) + self.offset - 1)
+        cumulative = numpy.concatenate(([0], numpy.cumsum(self.counts)))
+
+        if range is None:
+            range = (bounds[used[0]], bounds[used[-1] + 1])
+        edges = numpy.linspace(range[0], range[1], bins + 1)
+        hist = numpy.diff(numpy.interp(edges, bounds, cumulative))
+        if density:
+            hist = hist / (cumulative[-1] * numpy.diff(edges))
+        return (hist, edges)
+
+    def dumps(self):
+        """Returns the sketch as a string, see loadSketch()."""
+
+        used = numpy.flatnonzero(self.counts)
+        return marshal.dumps((SKETCH_VERSION, self.accuracy, self.minimum,
+                              self.maximum, float(self.sum), float(self.squares),
+                              used.astype("<i4").tostring(),
+                              self.counts[used].astype("<i8").tostring()))
+
+def loadSketch(data):
+    """Returns the QuantileSketch serialized by QuantileSketch.dumps()."""
+
+    (version, accuracy, minimum, maximum, sum, squares, used, counts) = \
+            marshal.loads(str(data))
+    if version != SKETCH_VERSION:
+        raise ValueError("unsupported sketch version %s" % version)
+
+    sketch = QuantileSketch(accuracy, minimum, maximum)
+    sketch.sum = sum
+    sketch.squares = squares
+    sketch.counts[numpy.fromstring(used, dtype = "<i4")] = \
+            numpy.fromstring(counts, dtype = "<i8")
+    return sketch
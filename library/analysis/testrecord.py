@@ -15,58 +15,457 @@
 # more details.
 
 # python imports
+import os
+import re
+import copy
+import mmap
+import hashlib
+import marshal
+import subprocess
 from logging import info, debug, warn, error
 
+# bump if the way the output is scanned changes
+PARSER_VERSION = 1
+
+# suffixes and magic bytes of compressed logs and how to decompress them
+COMPRESSIONS = [ (".gz",  "\x1f\x8b",         ["gzip", "-dc"]),
+                 (".xz",  "\xfd7zXZ\x00",     ["xz", "-dc"]),
+                 (".zst", "\x28\xb5\x2f\xfd", ["zstd", "-dc"]) ]
+
+class LogFile:
+    """A test log opened for reading. Plain logs are memory mapped, so
+       that records loaded in parallel share the page cache instead of
+       copying the log into their own buffers. Compressed logs are
+       recognized by their suffix or magic bytes and decompressed on the
+       fly by piping them through the decompressor, so they are never read
+       as a whole.
+    """
+
+    def __init__(self, filename):
+        self.process = None
+        self.mm = None
+
+        command = None
+        fh = open(filename, "rb")
+        magic = fh.read(6)
+        fh.seek(0)
+        for (suffix, signature, decompress) in COMPRESSIONS:
+            if filename.endswith(suffix) or magic.startswith(signature):
+                command = decompress + [filename]
+                break
+
+        if command is None:
+            self.fh = fh
+            try:
+                self.mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+            except (ValueError, mmap.error):
+                # empty logs can not be mapped
+                pass
+            return
+
+        fh.close()
+        try:
+            self.process = subprocess.Popen(command, stdout=subprocess.PIPE,
+                                            stderr=subprocess.PIPE, bufsize=-1)
+        except OSError, inst:
+            raise IOError("%s: failed to run %s: %s" % (filename, command[0], inst))
+        self.fh = self.process.stdout
+        self.filename = filename
+
+    def __iter__(self):
+        if self.mm is not None:
+            return iter(self.mm.readline, "")
+        return iter(self.fh)
+
+    def readline(self):
+        if self.mm is not None:
+            return self.mm.readline()
+        return self.fh.readline()
+
+    def read(self):
+        if self.mm is not None:
+            return self.mm.read(self.mm.size() - self.mm.tell())
+        return self.fh.read()
+
+    def seek(self, offset):
+        """Moves forward to offset, pipes are read up to it"""
+
+        if self.mm is not None:
+            self.mm.seek(min(offset, self.mm.size()))
+            return
+        if self.process is None:
+            self.fh.seek(offset)
+            return
+        while offset > 0:
+            chunk = self.fh.read(min(offset, 65536))
+            if not chunk:
+                break
+            offset -= len(chunk)
+
+    def close(self):
+        if self.mm is not None:
+            self.mm.close()
+        if self.process is None:
+            self.fh.close()
+            return
+
+        # stop the decompressor if the log was not read up
+        if self.process.poll() is None:
+            self.process.terminate()
+        self.fh.close()
+        errors = self.process.stderr.read()
+        self.process.stderr.close()
+        if self.process.wait() > 0:
+            warn("%s: decompression failed: %s" % (self.filename, errors.strip()))
+
+def compressedLog(filename):
+    """Returns the name of the compressed log of filename, e.g. of a log
+       compressed after the test, or None if there is none."""
+
+    for (suffix, signature, decompress) in COMPRESSIONS:
+        if os.path.exists(filename + suffix):
+            return filename + suffix
+    return None
+
+def readHeader(filename):
+    """Reads the header of a test log. Returns the header as a dictionary
+       and the offset where the test output starts."""
+
+    fh = LogFile(filename)
+    header = dict()
+
+    # read header
+    offset = 0
+    while 1:
+        line = fh.readline()
+        offset += len(line)
+        line = line.strip()
+        if line.startswith("BEGIN_TEST_OUTPUT"):
+            break
+        try:
+            (key, value) = line.split("=",1)
+            header[key] = value
+        except ValueError:
+            warn("%s: Error parsing Header! No Header??" % filename)
+            offset = 0
+            break
+
+    fh.close()
+    return (header, offset)
+
+class LineScanner:
+    """Scans the output of a test in a single pass.
+       Every line is only matched against the regexes routed to its leading
+       token (the first whitespace separated word, e.g. "S:" or "#"). Lines
+       with a token without route are matched against all regexes. Regexes
+       anchored by "^" only apply to the first line, as if the whole output
+       was scanned at once.
+    """
+
+    def __init__(self, regexes, routes = None):
+        self.regexes = regexes
+
+        # per token a list of (index, regex), the first line gets its own
+        # routes as only this line is allowed to match anchored regexes
+        def table(anchored):
+            return [(i, r) for (i, r) in enumerate(regexes)
+                    if anchored or not self.isAnchored(r)]
+
+        # identifies the parser, e.g. for the parse cache
+        patterns = [(r.pattern, r.flags) for r in regexes]
+        self.version = hashlib.md5(repr((PARSER_VERSION, marshal.version,
+                                         patterns))).hexdigest()
+
+        self.default = table(False)
+        self.default_first = table(True)
+        self.routes = dict()
+        self.routes_first = dict()
+        for (token, subset) in (routes or dict()).iteritems():
+            self.routes[token] = [(i, r) for (i, r) in self.default if r in subset]
+            self.routes_first[token] = [(i, r) for (i, r) in self.default_first if r in subset]
+
+    def isAnchored(self, regex):
+        return regex.pattern.startswith("^") and not regex.flags & re.MULTILINE
+
+    def producing(self, groups = None):
+        """Returns the indices of the regexes producing one of the given
+           groups (all if groups is None). Regexes sharing a group with them
+           are included as well, so that values of a group always come from
+           a single scan.
+        """
+
+        if groups is None:
+            return set(range(len(self.regexes)))
+
+        groups = set(groups)
+        indices = set()
+        while True:
+            found = set(i for (i, r) in enumerate(self.regexes)
+                        if groups.intersection(r.groupindex))
+            if found == indices:
+                return indices
+            indices = found
+            for i in indices:
+                groups.update(self.regexes[i].groupindex)
+
+    def scan(self, lines, results, indices = None, first = True):
+        """Matches all lines and appends the named groups to the lists in
+           results. Values are ordered by regex first, then by line. If
+           indices is given only these regexes are matched. Unless first is
+           set, the lines do not start at the beginning of the output.
+        """
+
+        found = [dict() for regex in self.regexes]
+        if first:
+            routes = self.routes_first
+            default = self.default_first
+        else:
+            routes = self.routes
+            default = self.default
+
+        if indices is not None:
+            def select(table):
+                return [(i, r) for (i, r) in table if i in indices]
+            routes = dict((t, select(c)) for (t, c) in routes.iteritems())
+            default = select(default)
+            routes_rest = dict((t, select(c)) for (t, c) in self.routes.iteritems())
+            default_rest = select(self.default)
+        else:
+            routes_rest = self.routes
+            default_rest = self.default
+
+        for line in lines:
+            tokens = line.split(None, 1)
+            if tokens:
+                candidates = routes.get(tokens[0], default)
+            else:
+                candidates = default
+            routes = routes_rest
+            default = default_rest
+
+            for (i, regex) in candidates:
+                values = found[i]
+                for match in regex.finditer(line):
+                    for key, value in match.groupdict().iteritems():
+                        try:
+                            values[key].append(value)
+                        except KeyError:
+                            values[key] = [value]
+
+        for values in found:
+            for key, value in values.iteritems():
+                try:
+                    results[key].extend(value)
+                except KeyError:
+                    results[key] = value
+
 class TestRecord:
     """A record of a single Test.
-       For performance reasons it expects already compiled regexes and
-       an initialize dict with function pointers to calculate results,
-       from parsed values.
+       For performance reasons it expects a LineScanner (or already
+       compiled regexes) and an initialize dict with function pointers to
+       calculate results, from parsed values.
+       Only the header is read on creation, the output is parsed on demand.
+       The optional dict requires maps a what to the regex groups it needs,
+       whats without an entry need all of them. Calculated values are
+       cached per what and arguments. Callers get a shallow copy of a
+       cached value, the items of lists and dicts, e.g. the arrays of the
+       flows, are shared and must not be modified.
+       If parsecache is set, the header and the parsed output are kept in
+       a hidden file next to the log and reused as long as neither the log
+       nor the parser changes. A record can also be created from the state
+       of a record parsed elsewhere, e.g. in another process.
     """
 
-    def __init__(self, filename, regexes, whats):
+    parsecache = False
+
+    def __init__(self, filename, scanner, whats, requires = None, state = None):
         self.results = dict()
         self.filename = filename
         self.whats = whats
+        self.requires = requires or dict()
         self.valid = True
         self.header = dict()
 
-        self.parse(regexes)
+        # calculated values and cache statistics
+        self.cache = dict()
+        self.cache_hits = 0
+        self.cache_misses = 0
 
-    def parse(self, regexes):
-        """Parses the file associated with this record."""
+        if not isinstance(scanner, LineScanner):
+            scanner = LineScanner(scanner)
+        self.scanner = scanner
 
-        fh = open(self.filename, "r")
+        # regexes not yet matched and where the test output starts
+        self.pending = scanner.producing()
+        self.offset = 0
 
-        # read header
-        while 1:
-            line = fh.readline()
-            line = line.strip()
-            if line.startswith("BEGIN_TEST_OUTPUT"):
-                break
-            try:
-                (key, value) = line.split("=",1)
-                self.header[key] = value
-            except ValueError:
-                warn("%s: Error parsing Header! No Header??" % self.filename)
-                fh.seek(0)
-                break
+        # where a followed log has been scanned up to
+        self.end = None
+
+        if state is not None:
+            self.setState(state)
+        elif not (self.parsecache and self.loadParseCache()):
+            self.parseHeader()
+
+    def parseHeader(self):
+        """Parses the header of the file associated with this record. If
+           the file does not exist, its compressed log is used instead."""
+
+        try:
+            (self.header, self.offset) = readHeader(self.filename)
+        except IOError:
+            filename = compressedLog(self.filename)
+            if filename is None:
+                raise
+            self.filename = filename
+            if not (self.parsecache and self.loadParseCache()):
+                (self.header, self.offset) = readHeader(self.filename)
+
+    def parse(self, groups = None):
+        """Parses the output of the file associated with this record for
+           the given regex groups (all if None). Regexes which were already
+           matched are not matched again."""
+
+        indices = self.pending & self.scanner.producing(groups)
+        if not indices:
+            return
+
+        fh = LogFile(self.filename)
+        fh.seek(self.offset)
+
+        # scan the rest line by line
+        self.scanner.scan(fh, self.results, indices)
+        self.pending -= indices
+
+        fh.close()
+
+        if self.parsecache:
+            self.saveParseCache()
+
+    def prepare(self, whats = None):
+        """Parses the output needed to calculate the given whats (all if
+           None), so later calls of calculate() do not touch the log."""
+
+        if whats is None:
+            return self.parse()
+
+        groups = set()
+        for what in whats:
+            if self.requires.get(what) is None:
+                return self.parse()
+            groups.update(self.requires[what])
+        self.parse(groups)
+
+    def getState(self):
+        """Returns header and parsed output as a marshalable dictionary."""
 
-        # read the rest
-        output = fh.read()
+        return dict(filename = self.filename,
+                    header = self.header,
+                    offset = self.offset,
+                    results = self.results,
+                    parsed = list(self.scanner.producing() - self.pending))
 
-        for regex in regexes:
-            matches = regex.finditer(output)
+    def setState(self, state):
+        """Restores header and parsed output returned by getState()."""
 
-            for match in matches:
-                for key, value in match.groupdict().iteritems():
-                    try:
-                        self.results[key].append(value)
-                    except KeyError:
-                        self.results[key] = [value]
+        self.filename = state.get('filename', self.filename)
+        self.header = state['header']
+        self.offset = state['offset']
+        self.results = state['results']
+        self.pending -= set(state['parsed'])
 
+    def follow(self):
+        """Starts following a growing log, e.g. while the test is still
+           running. All regexes are matched against the complete lines
+           written so far, later calls of update() only match the lines
+           appended in the meantime."""
+
+        self.results = dict()
+        self.pending = set()
+        self.end = self.offset
+        self.invalidate()
+        return self.update()
+
+    def update(self):
+        """Matches all regexes against the complete lines appended to a
+           followed log since the last update and adds them to the results.
+           Cached values are dropped and the record is valid again, values
+           missing so far may be calculated now. Returns the new results
+           only."""
+
+        if self.end is None:
+            raise RuntimeError("%s: update() called before follow()" % self.filename)
+
+        fh = LogFile(self.filename)
+        fh.seek(self.end)
+        data = fh.read()
         fh.close()
 
+        # an incomplete last line is left for the next update
+        complete = data.rfind("\n") + 1
+        new = dict()
+        self.scanner.scan(data[:complete].splitlines(True), new,
+                          first = (self.end == self.offset))
+        self.end += complete
+
+        for key, values in new.iteritems():
+            try:
+                self.results[key].extend(values)
+            except KeyError:
+                self.results[key] = list(values)
+
+        self.invalidate()
+        self.valid = True
+        return new
+
+    def getParseCacheFilename(self):
+        (head, tail) = os.path.split(self.filename)
+        return os.path.join(head, ".%s.parsed" % tail)
+
+    def getParseCacheKey(self):
+        """Returns what identifies a valid parse cache for this record."""
+
+        stat = os.stat(self.filename)
+        return (os.path.abspath(self.filename), stat.st_size, stat.st_mtime,
+                self.scanner.version)
+
+    def loadParseCache(self):
+        """Loads header and parsed output from the parse cache. Returns
+           False if there is no valid cache."""
+
+        try:
+            fh = open(self.getParseCacheFilename(), "rb")
+            try:
+                data = marshal.load(fh)
+            finally:
+                fh.close()
+            if data['key'] != self.getParseCacheKey():
+                debug("%s: parse cache is outdated" % self.filename)
+                return False
+        except (IOError, OSError, EOFError, ValueError, TypeError, KeyError):
+            return False
+
+        self.setState(data)
+        return True
+
+    def saveParseCache(self):
+        """Stores header and parsed output in the parse cache."""
+
+        data = self.getState()
+
+        filename = self.getParseCacheFilename()
+        tmpname = "%s.%u" % (filename, os.getpid())
+        try:
+            data['key'] = self.getParseCacheKey()
+            fh = open(tmpname, "wb")
+            try:
+                marshal.dump(data, fh)
+            finally:
+                fh.close()
+            os.rename(tmpname, filename)
+        except (IOError, OSError), inst:
+            debug("%s: failed to write parse cache: %s" % (self.filename, inst))
+
     def getHeader(self):
         """Returns the header as a dictionary. """
         return self.header
@@ -74,13 +473,31 @@ class TestRecord:
     def calculate(self, what, optional = False, **kwargs):
         """Calculate the given value from parsed values.
            If calculation failes, this record is marked invalid, and None is returned.
+           Mutable values are returned as shallow copies of the cached ones.
         """
 
         if not self.valid:
             return None
 
+        key = (what, tuple(sorted(kwargs.iteritems())))
+        try:
+            value = self.cache[key]
+            self.cache_hits += 1
+            return copy.copy(value)
+        except KeyError:
+            self.cache_misses += 1
+        except TypeError:
+            # unhashable arguments can not be cached
+            key = None
+
+        self.parse(self.requires.get(what))
+
         try:
-            return self.whats[what](self.results, **kwargs);
+            value = self.whats[what](self.results, **kwargs)
+            if key is not None:
+                self.cache[key] = value
+                return copy.copy(value)
+            return value
         except KeyError, inst:
             if not optional:
                 warn("Failed to get required value %s out of %s: KeyError:%s" %(what, self.filename, inst))
@@ -89,6 +506,21 @@ class TestRecord:
                 debug("Failed to get optional value %s out of %s: KeyError:%s" %(what, self.filename, inst))
             return None
 
+    def invalidate(self, what = None):
+        """Drops the cached values of the given what (all if None)."""
+
+        if what is None:
+            self.cache.clear()
+            return
+
+        for key in self.cache.keys():
+            if key[0] == what:
+                del self.cache[key]
+
+    def getCacheStats(self):
+        """Returns the number of cache hits and misses as a tuple."""
+        return (self.cache_hits, self.cache_misses)
+
     def isValid(self):
         return self.valid
 
@@ -47,10 +47,20 @@ class TestRecordFactory:
         self.factories[test] = factory
         return factory
 
-    def createRecord(self, filename, test):
+    def getVersion(self, test):
+        """Returns the version of the parser for test logs of test."""
+
+        try:
+            factory = self.factories[test]
+        except KeyError:
+            factory = self.initFactory(test)
+
+        return factory.scanner.version
+
+    def createRecord(self, filename, test, state = None):
         try:
             createRecord = self.factories[test].createRecord
         except KeyError:
             createRecord = self.initFactory(test).createRecord
-        return createRecord(filename, test)
+        return createRecord(filename, test, state)
 
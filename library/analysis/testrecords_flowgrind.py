@@ -16,21 +16,52 @@
 # python imports
 import re
 import time
+import numpy
 from logging import info, debug, warn, error
 
 # tcp-eval imports
 from common.functions import StrictStruct
-from testrecord import TestRecord
+from testrecord import TestRecord, LineScanner
 
 class FlowgrindRecord(TestRecord):
-    def __init__(self, filename, regexes, whats):
-        TestRecord.__init__(self, filename, regexes, whats)
+    def __init__(self, filename, scanner, whats, requires, state = None):
+        TestRecord.__init__(self, filename, scanner, whats, requires, state)
+
+    def update(self):
+        """Like TestRecord.update(), but calculated flows are kept and
+           extended by the new interval rows only."""
+
+        flows = self.cache.get(("flows", ()))
+        if flows is not None:
+            flow_ids = sorted(set(map(int, self.results['flow_id'])))
+
+        new = TestRecord.update(self)
+        if flows is None or not 'flow_id' in new:
+            return new
+
+        # convert the new rows and append them to the flows
+        flow_map = dict(zip(flow_ids, flows))
+        new_ids = sorted(set(map(int, new['flow_id'])))
+        for (fid, flow) in zip(new_ids, self.whats['flows'](new)):
+            if not fid in flow_map:
+                flow_map[fid] = flow
+                continue
+            for d in ('S', 'D'):
+                for key in flow[d].keys():
+                    if key in ('direction', 'size'):
+                        continue
+                    flow_map[fid][d][key] = numpy.concatenate(
+                            (flow_map[fid][d][key], flow[d][key]))
+                flow_map[fid][d].size += flow[d].size
+
+        self.cache[("flows", ())] = [flow_map[fid] for fid in sorted(flow_map)]
+        return new
 
 
 class FlowgrindRecordFactory():
     def __init__(self):
         # keys
-         # raw_values and there convert function
+        # raw_values and the type of their column
         keys = { 'begin' : float,
                  'end'   : float,
                  'tput' : float,
@@ -54,98 +85,143 @@ class FlowgrindRecordFactory():
                  'krtt'    : float,
                  'krttvar' : float,
                  'krto'    : float,
-                 'castate' : lambda x:x,
+                 'castate' : str,
                  'mss'     : int,
                  'mtu'     : int,
                  # optional values
                  'dupthresh':int,
                  'revr':int
                  }
+        self.keys = keys
+
+        # symbolic values flowgrind prints instead of numbers
+        limits = { 'INT_MAX'  : '2147483647',
+                   'SHRT_MAX' : '32767' }
 
         def removeInf(val):
             return str(val) != 'inf'
 
 
+        def convert(values, dtype):
+            """Converts a list of matched strings into an array in one go"""
+
+            if dtype is str:
+                return numpy.array(values)
+
+            text = " ".join(values)
+            for (name, value) in limits.iteritems():
+                text = text.replace(name, value)
+            column = numpy.fromstring(text, dtype=dtype, sep=" ")
+            if len(column) != len(values):
+                raise ValueError("Failed to convert %s values" %dtype.__name__)
+            return column
+
+        # convenience function to convert the interval columns at once
+        # and to split them up by flow id and direction
+        def flow_columns(r, wanted=keys):
+
+            flow_id = convert(r['flow_id'], int)
+            # D,R (for compability)
+            source = numpy.array(r['direction']) == 'S'
+
+            # bulk conversion of all rows of a key
+            columns = dict()
+            for key in wanted:
+                dtype = keys[key]
+                try:
+                    columns[key] = convert(r[key], dtype)
+                except KeyError, inst:
+                    # ignore optional dupthresh and rvr
+                    if key in ['dupthresh','revr']:
+                        columns[key] = None
+                        continue
+                    warn('KeyError: Failed to get r["%s"]' %key)
+                    raise inst
+                except TypeError, inst:
+                    # ignore optional dupthresh and rvr
+                    if key in ['dupthresh','revr']:
+                        columns[key] = None
+                        continue
+                    warn('TypeError: Failed to get r["%s"]' %key)
+                    raise inst
+
+            # select the rows of every flow and direction
+            flow_map = dict()
+            for fid in map(int, numpy.unique(flow_id)):
+                flow_map[fid] = dict()
+                for (d, rows) in (('S', source), ('D', ~source)):
+                    index = numpy.flatnonzero((flow_id == fid) & rows)
+                    flow = StrictStruct(direction=d, size=len(index), **columns)
+                    for key in wanted:
+                        if columns[key] is None:
+                            flow[key] = numpy.array([], dtype=keys[key])
+                        else:
+                            flow[key] = columns[key][index]
+                    flow_map[fid][d] = flow
+            return flow_map
+
         # convenience function to group flows
         def group_flows(r):
+            flow_map = flow_columns(r)
+            return [flow_map[fid] for fid in sorted(flow_map)]
 
-            flow_ids = map(int, set(r['flow_id']))
-            flow_map = dict()
+        def outages(r, min_retr=1, min_time=0, time_abs=0, thresholds=None):
+            """An outage is a run of intervals with timeout retransmissions
+               (tret > 0) which ends before the flow does. If a list of
+               (min_retr, min_time) tuples is given as thresholds, a list
+               with the outages for each of them is returned instead."""
 
-            # initialize value records
-            for flow_id in flow_ids:
-                flow_map[flow_id] = dict()
-                flow_map[flow_id]['S'] = StrictStruct(direction='S', size=0, **keys)
-                flow_map[flow_id]['D'] = StrictStruct(direction='D', size=0, **keys)
-                for key in keys.iterkeys():
-                    flow_map[flow_id]['S'][key] = list()
-                    flow_map[flow_id]['D'][key] = list()
-
-            # iterate over all entries, rearrange and convert
-            for i in range(len(r['flow_id'])):
-                if r['direction'][i] == 'S':
-                    d = 'S'
-                else: # D,R (for compability)
-                    d = 'D'
-
-                flow = flow_map[int(r['flow_id'][i])][d]
-                for (key, convert) in keys.iteritems():
-                    try:
-                        flow[key].append(convert(r[key][i]))
-                    except KeyError, inst:
-                        # ignore optional dupthresh and rvr
-                        if key in ['dupthresh','revr']:
-                            continue
-                        warn('KeyError: Failed to get r["%s"][%u]' %(key,i))
-                        raise inst
-                    except TypeError, inst:
-                        # ignore optional dupthresh and rvr
-                        if key in ['dupthresh','revr']:
-                            continue
-                        warn('TypeError: Failed to get r["%s"][%u]' %(key,i))
-                        raise inst
-                flow.size += 1
-            return flow_map.values()
+            single = thresholds is None
+            if single:
+                thresholds = [(min_retr, min_time)]
+            results = [dict() for t in thresholds]
 
-        def outages(r, min_retr=1, min_time=0, time_abs=0):
-            flow_map = dict()
-            outages = dict()
             if time_abs: time_abs = time.mktime(time.strptime(r['test_start_time'][0]))
-            if not 'begin' in r: return outages
-            for i in range(len(r['begin'])):
-
-                if r['direction'][i] == 'S':
-                    dir = 'S'
-                else: # D,R
-                    dir = 'D'
-                flow_id = int(r['flow_id'][i])
-                tretr = int(r['tret'][i])
-                bkof = int(r['bkof'][i])
-                #revr = abs(tretr-bkof) #int(r['revr'][i])
-                revr = int(r['revr'][i])
-                if flow_id not in flow_map: flow_map[flow_id] = dict()
-                if dir not in flow_map[flow_id]: flow_map[flow_id][dir] = None
-
-                if flow_map[flow_id][dir] is None and tretr > 0:
-                    flow_map[flow_id][dir] = dict(begin=i, tretr=tretr, revr=revr, bkof=bkof)
-                if flow_map[flow_id][dir] is not None:
-                    tmp = flow_map[flow_id][dir]
-                    if tretr > 0:
-                        tmp['tretr'] = tretr
-                        tmp['revr'] = revr
-                        tmp['bkof'] = bkof
-                    else:
-                        b = float(r['begin'][tmp['begin']])
-                        e = float(r['begin'][i])
-                        tre = float(tmp['tretr'])
-                        rev = float(tmp['revr'])
-                        bk = float(tmp['bkof'])
-                        if tre >= min_retr and e - b >= min_time:
-                            if flow_id not in outages: outages[flow_id] = dict()
-                            if dir not in outages[flow_id]: outages[flow_id][dir] = []
-                            outages[flow_id][dir].append(dict(begin=b+time_abs,end=e+time_abs,tretr=tre,revr=rev,bkof=bk))
-                        flow_map[flow_id][dir] = None
-            return outages
+            if not 'begin' in r:
+                if single:
+                    return results[0]
+                return results
+
+            wanted = ('begin', 'tret', 'revr', 'bkof')
+            for (flow_id, flow) in flow_columns(r, wanted).iteritems():
+                for (dir, values) in flow.iteritems():
+                    if len(values['revr']) != values.size:
+                        raise KeyError('revr')
+
+                    # runs start where tret gets positive and stop at the
+                    # first interval where it is zero again
+                    active = numpy.concatenate(([0], values['tret'] > 0, [0]))
+                    edges = numpy.diff(active.astype(numpy.int8))
+                    starts = numpy.flatnonzero(edges == 1)
+                    stops = numpy.flatnonzero(edges == -1)
+                    # drop a run lasting until the end of the flow
+                    if len(stops) and stops[-1] == values.size:
+                        starts = starts[:-1]
+                        stops = stops[:-1]
+                    if not len(stops):
+                        continue
+
+                    # counters of the last interval of each run
+                    last = stops - 1
+                    begin = values['begin'][starts]
+                    end = values['begin'][stops]
+                    tretr = values['tret'][last].astype(float)
+                    revr = values['revr'][last].astype(float)
+                    bkof = values['bkof'][last].astype(float)
+
+                    for (outages, (min_retr, min_time)) in zip(results, thresholds):
+                        hits = numpy.flatnonzero((tretr >= min_retr) & (end - begin >= min_time))
+                        if not len(hits):
+                            continue
+                        if flow_id not in outages: outages[flow_id] = dict()
+                        outages[flow_id][dir] = [dict(begin=b+time_abs, end=e+time_abs, tretr=tre, revr=rev, bkof=bk)
+                                                 for (b, e, tre, rev, bk) in zip(begin[hits].tolist(), end[hits].tolist(),
+                                                                                  tretr[hits].tolist(), revr[hits].tolist(),
+                                                                                  bkof[hits].tolist())]
+
+            if single:
+                return results[0]
+            return results
 
 
         # phase 1 data gathering
@@ -202,6 +278,25 @@ class FlowgrindRecordFactory():
         # compile regexes
         self.regexes = map(re.compile, regexes)
 
+        # route lines by their leading token, so that the interval lines
+        # are only matched against the interval regex
+        def startingWith(*prefixes):
+            return [r for r in self.regexes if r.pattern.startswith(prefixes)]
+
+        src_summary = startingWith("S: ")
+        dst_summary = startingWith("[R,D]: ")
+        comments    = startingWith("# ", "^# ")
+        intervals   = startingWith("(?P<direction>")
+        routes = { 'S:' : src_summary,
+                   'R:' : dst_summary,
+                   'D:' : dst_summary,
+                   # newer flowgrind versions prefix summary lines with "# ID"
+                   '#'  : comments + src_summary + dst_summary,
+                   'S'  : intervals,
+                   'R'  : intervals,
+                   'D'  : intervals }
+        self.scanner = LineScanner(self.regexes, routes)
+
         def extInt(a):
             try:
                 ret = int(a)
@@ -241,6 +336,7 @@ class FlowgrindRecordFactory():
             forward_tput_list = lambda r: map(float, r['forward_tput_list']),
             reverse_tput_list = lambda r: map(float, r['reverse_tput_list']),
             test_start_time   = lambda r: time.mktime(time.strptime(r['test_start_time'][0])),
+            reporting_interval = lambda r: float(r['reporting_interval'][0]),
             outages           = outages,
             # icmp stats
             s_icmp_code_0 = lambda r: sum(map(int, r['s_icmp_code_0'])),
@@ -249,6 +345,42 @@ class FlowgrindRecordFactory():
             d_icmp_code_1 = lambda r: sum(map(int, r['d_icmp_code_1'])),
         )
 
-    def createRecord(self, filename, test):
-        return FlowgrindRecord(filename, self.regexes, self.whats)
+        # regex groups needed by the whats, so that only the regexes
+        # producing them are matched
+        self.requires = dict(
+            thruput           = ['s_thruput_out'],
+            thruput_recv      = ['d_thruput_out'],
+            rtt_min           = ['s_rtt_min'],
+            rtt_max           = ['s_rtt_max'],
+            rtt_avg           = ['s_rtt_avg'],
+            total_retransmits      = ['cret'],
+            total_fast_retransmits = ['cfret'],
+            total_rto_retransmits  = ['ctret'],
+            thruput_list      = ['s_thruput_out'],
+            thruput_recv_list = ['d_thruput_out'],
+            transac_list      = ['s_transac'],
+            rtt_min_list      = ['s_rtt_min'],
+            rtt_max_list      = ['s_rtt_max'],
+            rtt_avg_list      = ['s_rtt_avg'],
+            iat_min_list      = ['d_iat_min'],
+            iat_max_list      = ['d_iat_max'],
+            iat_avg_list      = ['d_iat_avg'],
+            lport_list        = ['lport'],
+            flow_ids          = ['flow_id'],
+            flows             = keys.keys() + ['flow_id', 'direction'],
+            flow_id_list      = ['flow_id'],
+            forward_tput_list = ['forward_tput_list'],
+            reverse_tput_list = ['reverse_tput_list'],
+            test_start_time   = ['test_start_time'],
+            reporting_interval = ['reporting_interval'],
+            outages           = ['begin', 'test_start_time'],
+            s_icmp_code_0 = ['s_icmp_code_0'],
+            s_icmp_code_1 = ['s_icmp_code_1'],
+            d_icmp_code_0 = ['d_icmp_code_0'],
+            d_icmp_code_1 = ['d_icmp_code_1'],
+        )
+
+    def createRecord(self, filename, test, state = None):
+        return FlowgrindRecord(filename, self.scanner, self.whats, self.requires,
+                               state)
 
@@ -18,11 +18,11 @@ import re
 from logging import info, debug, warn, error
 
 # tcp-eval imports
-from testrecord import TestRecord
+from testrecord import TestRecord, LineScanner
 
 class FpingRecord(TestRecord):
-    def __init__(self, filename, regexes, whats):
-        TestRecord.__init__(self, filename, regexes, whats)
+    def __init__(self, filename, scanner, whats, state = None):
+        TestRecord.__init__(self, filename, scanner, whats, state = state)
 
 
 class FpingRecordFactory():
@@ -42,6 +42,7 @@ class FpingRecordFactory():
 
         # compile regexes
         self.regexes = map(re.compile, regexes)
+        self.scanner = LineScanner(self.regexes)
 
         # phase 2 result calculation
         # these functions get a dict of lists as an argument which
@@ -69,6 +70,6 @@ class FpingRecordFactory():
             packet_loss = lambda r: 1-float(r['pkt_rx'][0])/float(r['pkt_tx'][0])
         )
 
-    def createRecord(self, filename, test):
-        return FpingRecord(filename, self.regexes, self.whats)
+    def createRecord(self, filename, test, state = None):
+        return FpingRecord(filename, self.scanner, self.whats, state)
 
@@ -19,11 +19,11 @@ from logging import info, debug, warn, error
 from numpy import array
 
 # tcp-eval imports
-from testrecord import TestRecord
+from testrecord import TestRecord, LineScanner
 
 class PingRecord(TestRecord):
-    def __init__(self, filename, regexes, whats):
-        TestRecord.__init__(self, filename, regexes, whats)
+    def __init__(self, filename, scanner, whats, state = None):
+        TestRecord.__init__(self, filename, scanner, whats, state = state)
 
 
 class PingRecordFactory():
@@ -63,6 +63,7 @@ class PingRecordFactory():
 
         # compile regexes
         self.regexes = map(re.compile, regexes)
+        self.scanner = LineScanner(self.regexes)
 
         # phase 2 result calculation
         # these functions get a dict of lists as an argument which
@@ -99,6 +100,6 @@ class PingRecordFactory():
             packet_loss = lambda r: 1-float(r['pkt_rx'][0])/float(r['pkt_tx'][0])
         )
 
-    def createRecord(self, filename, test):
-        return PingRecord(filename, self.regexes, self.whats)
+    def createRecord(self, filename, test, state = None):
+        return PingRecord(filename, self.scanner, self.whats, state)
 
@@ -18,11 +18,11 @@ import re
 from logging import info, debug, warn, error
 
 # tcp-eval imports
-from testrecord import TestRecord
+from testrecord import TestRecord, LineScanner
 
 class RateRecord(TestRecord):
-    def __init__(self, filename, regexes, whats):
-        TestRecord.__init__(self, filename, regexes, whats)
+    def __init__(self, filename, scanner, whats, state = None):
+        TestRecord.__init__(self, filename, scanner, whats, state = state)
 
 
 class RateRecordFactory():
@@ -89,6 +89,7 @@ class RateRecordFactory():
 
         # compile regexes
         self.regexes = map(re.compile, regexes)
+        self.scanner = LineScanner(self.regexes)
 
         # phase 2 result calculation
         # these functions get a dict of lists as an argument which
@@ -101,6 +102,6 @@ class RateRecordFactory():
             average_rate = calcAverageRate
         )
 
-    def createRecord(self, filename, test):
-        return RateRecord(filename, self.regexes, self.whats)
+    def createRecord(self, filename, test, state = None):
+        return RateRecord(filename, self.scanner, self.whats, state)
 
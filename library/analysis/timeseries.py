@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vi:et:sw=4 ts=4
+
+# Copyright (C) 2013 Alexander Zimmermann <alexander.zimmermann@netapp.com>
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms and conditions of the GNU General Public License,
+# version 2, as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for
+# more details.
+
+# python imports
+import math
+import numpy
+from logging import info, debug, warn, error
+
+def isNumeric(values):
+    """Returns True if values is an array of numbers."""
+    return isinstance(values, numpy.ndarray) and values.dtype.kind in "biuf"
+
+def resampleColumns(columns, rate):
+    """Averages the columns, a dictionary of arrays of the same length, over
+       consecutive windows of rate samples. rate may be fractional, a
+       sample split by two windows counts in both with its fractions, the
+       last window may be shorter. All columns are resampled at once from
+       their cumulative sums. Returns a dictionary with the averaged
+       columns as float arrays."""
+
+    names = sorted(columns)
+    if not names:
+        return dict()
+    data = numpy.array([columns[name] for name in names], dtype = float)
+    size = data.shape[1]
+
+    # bounds of the windows in samples
+    count = int(math.ceil(size / float(rate) - 1e-9))
+    bounds = numpy.minimum(numpy.arange(count + 1) * float(rate), size)
+    whole = numpy.floor(bounds).astype(int)
+    fraction = bounds - whole
+
+    # flowgrind logs inf, e.g. for the RTT of intervals without one. Such
+    # values are left out of the sums and make their windows inf (or NaN)
+    bad = ~numpy.isfinite(data)
+    if bad.any():
+        clean = numpy.where(bad, 0, data)
+    else:
+        clean = data
+
+    # sum up to each bound, with the fraction of the sample it splits. The
+    # sums are extended precision, columns like ssth mix huge and small
+    # values and the windows are differences of the sums
+    sums = numpy.zeros((len(names), size + 1), dtype = numpy.longdouble)
+    numpy.cumsum(clean, axis = 1, out = sums[:, 1:])
+    clean = numpy.concatenate((clean, numpy.zeros((len(names), 1))), axis = 1)
+    sums = sums[:, whole] + fraction * clean[:, whole]
+
+    means = (numpy.diff(sums, axis = 1) / numpy.diff(bounds)).astype(float)
+
+    if bad.any():
+        # samples with a share in each window
+        first = whole[:-1]
+        last = numpy.ceil(bounds[1:]).astype(int)
+        for (row, column) in zip(*numpy.nonzero(bad)):
+            windows = numpy.flatnonzero((first <= column) & (column < last))
+            # inf and -inf in a window are NaN
+            with numpy.errstate(invalid = "ignore"):
+                means[row, windows] += data[row, column]
+
+    return dict(zip(names, means))
+
+def _slots(series, step):
+    """Returns the grid points of the begins of every series, as a slice if
+       they are consecutive like usually, and the number of grid points."""
+
+    slots = list()
+    length = 0
+    for s in series:
+        slot = numpy.rint(numpy.asarray(s['begin']) / step).astype(int)
+        if len(slot):
+            length = max(length, slot.max() + 1)
+            # slices are much faster to index with
+            if slot[-1] - slot[0] == len(slot) - 1 and (numpy.diff(slot) == 1).all():
+                slot = slice(slot[0], slot[-1] + 1)
+        slots.append(slot)
+    return (slots, length)
+
+def _size(slot):
+    """Returns the number of grid points of a series."""
+
+    if isinstance(slot, slice):
+        return slot.stop - slot.start
+    return len(slot)
+
+def _matrix(series, slots, length, name):
+    """Returns the values of column name of every series at its grid points
+       as an array with a row per series, NaN where it has none."""
+
+    values = numpy.empty((len(series), length))
+    values.fill(numpy.nan)
+    for (row, (s, slot)) in enumerate(zip(series, slots)):
+        values[row, slot] = s[name][:_size(slot)]
+    return values
+
+def align(series, step, names):
+    """Aligns the columns names of several series, e.g. the same flow of
+       several logs, on a common time grid of step seconds. Each series is a
+       dictionary with the column begin and the named columns. Returns the
+       begins of the grid and a dictionary mapping each name to an array
+       with a row per series and a column per grid point, which is NaN
+       where a series has no value."""
+
+    (slots, length) = _slots(series, step)
+
+    aligned = dict()
+    for name in names:
+        aligned[name] = _matrix(series, slots, length, name)
+
+    return (numpy.arange(length) * step, aligned)
+
+def aggregateSeries(series, step, names, statistics = ("mean",)):
+    """Aligns several series like align() and computes every statistic
+       (see percentileOf()) of the columns names at every grid point over
+       the series which have a value there. Means are summed up series by
+       series, only percentiles need the aligned values of a column at once.
+       Returns the begins of the grid and a dictionary mapping each
+       statistic to a dictionary mapping each name to its values."""
+
+    for statistic in statistics:
+        percentileOf(statistic)
+
+    (slots, length) = _slots(series, step)
+    results = dict([(statistic, dict()) for statistic in statistics])
+
+    if "mean" in statistics:
+        count = numpy.zeros(length)
+        for slot in slots:
+            count[slot] += 1
+        valid = count > 0
+
+        for name in names:
+            total = numpy.zeros(length)
+            for (s, slot) in zip(series, slots):
+                total[slot] += s[name][:_size(slot)]
+            mean = numpy.empty(length)
+            mean.fill(numpy.nan)
+            mean[valid] = total[valid] / count[valid]
+            results["mean"][name] = mean
+
+    percentiles = [statistic for statistic in statistics if statistic != "mean"]
+    if percentiles:
+        for name in names:
+            values = _matrix(series, slots, length, name)
+            qs = [percentileOf(statistic) for statistic in percentiles]
+            for (statistic, result) in zip(percentiles, _percentiles(values, qs)):
+                results[statistic][name] = result
+
+    return (numpy.arange(length) * step, results)
+
+def percentileOf(statistic):
+    """Returns the percentile of statistic (mean, median or pNN, e.g. p90),
+       or None for mean. Raises a ValueError for unknown statistics."""
+
+    if statistic == "mean":
+        return None
+    if statistic == "median":
+        return 50.0
+    try:
+        if statistic.startswith("p"):
+            q = float(statistic[1:])
+            if 0 <= q <= 100:
+                return q
+    except ValueError:
+        pass
+    raise ValueError("unknown statistic %s" % statistic)
+
+def _percentiles(values, qs):
+    """Returns the percentiles qs over the rows of values for every column,
+       leaving out NaN, with one sort of values."""
+
+    count = len(values) - numpy.isnan(values).sum(axis = 0)
+    valid = count > 0
+    last = numpy.maximum(count - 1, 0)
+    columns = numpy.arange(values.shape[1])
+
+    # NaN are sorted last
+    ordered = numpy.sort(values, axis = 0)
+
+    results = list()
+    for q in qs:
+        rank = q / 100 * last
+        lower = numpy.floor(rank).astype(int)
+        upper = numpy.minimum(lower + 1, last)
+        low = ordered[lower, columns]
+        high = ordered[upper, columns]
+
+        # interpolate only between different values, they may be inf
+        between = valid & (rank > lower) & (high != low)
+        result = numpy.where(valid, low, numpy.nan)
+        result[between] += (rank[between] - lower[between]) * \
+                (high[between] - low[between])
+        results.append(result)
+    return results
+
+def aggregate(values, statistic = "mean"):
+    """Computes statistic (see percentileOf()) over the rows of values for
+       every column, leaving out NaN. Percentiles are interpolated linearly
+       like numpy.percentile(). Columns without any value are NaN."""
+
+    q = percentileOf(statistic)
+    values = numpy.asarray(values, dtype = float)
+    if q is not None:
+        return _percentiles(values, [q])[0]
+
+    missing = numpy.isnan(values)
+    count = len(values) - missing.sum(axis = 0)
+    valid = count > 0
+
+    result = numpy.empty(values.shape[1:])
+    result.fill(numpy.nan)
+    total = numpy.where(missing, 0, values).sum(axis = 0)
+    result[valid] = total[valid] / count[valid]
+    return result
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vi:et:sw=4 ts=4
+
+# Copyright (C) 2013 Alexander Zimmermann <alexander.zimmermann@netapp.com>
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms and conditions of the GNU General Public License,
+# version 2, as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for
+# more details.
+
+# python imports
+import os
+import os.path
+import json
+from logging import info, debug, warn, error
+
+# name of the manifest in a log directory
+MANIFEST = ".manifest"
+
+def appendManifest(log_dir, **entry):
+    """Appends an entry for a completed test to the manifest of log_dir.
+       The manifest is append-only with one JSON object per line, entries
+       are expected to carry path (relative to log_dir), iteration,
+       scenario, run, test, header, rc, start and end."""
+
+    line = json.dumps(entry, sort_keys = True)
+    fh = open(os.path.join(log_dir, MANIFEST), "a")
+    try:
+        fh.write(line + "\n")
+    finally:
+        fh.close()
+
+def readManifest(log_dir):
+    """Returns the entries of the manifest of log_dir in the order they were
+       written, or None if there is no manifest. A later entry for the same
+       path replaces an earlier one, but a test appending to a log keeps its
+       header. Broken lines, e.g. of an interrupted write, are skipped."""
+
+    try:
+        fh = open(os.path.join(log_dir, MANIFEST))
+    except IOError:
+        return None
+
+    entries = dict()
+    order = list()
+    try:
+        for (lineNo, line) in enumerate(fh):
+            try:
+                entry = json.loads(line)
+                path = entry["path"]
+            except (ValueError, KeyError, TypeError):
+                warn("%s: skipping broken manifest line %u"
+                        %(log_dir, lineNo + 1))
+                continue
+
+            if not path in entries:
+                order.append(path)
+            elif entry.get("append"):
+                entry["header"] = entries[path].get("header")
+            entries[path] = entry
+    finally:
+        fh.close()
+
+    return [entries[path] for path in order]
@@ -18,6 +18,7 @@
 import os.path
 import os
 import sys
+import re
 import time
 from logging import info, debug, warn, error, critical
 
@@ -29,6 +30,7 @@ import twisted.names.client
 
 # tcp-eval imports
 from common.application import Application
+from common.manifest import appendManifest
 from sshexec import SSHConnectionFactory
 from network.meshdb import MeshDbPool
 from network.xmlrpc import xmlrpc_many, xmlrpc
@@ -279,6 +281,7 @@ class Measurement(Application):
         log_name = "%s_%s" %(self.logprefix, test.func_name)
         log_path = os.path.join(self.args.log_dir, log_name)
 
+        start_time = time.time()
         if append:
             log_file = open(log_path, 'a')
         else:
@@ -287,7 +290,7 @@ class Measurement(Application):
             # write config into logfile
             for item in kwargs.iteritems():
                 log_file.write("%s=%s\n" %item)
-            log_file.write("test_start_time=%s\n" %time.time())
+            log_file.write("test_start_time=%s\n" %start_time)
             log_file.write("BEGIN_TEST_OUTPUT\n")
             log_file.flush()
 
@@ -303,6 +306,26 @@ class Measurement(Application):
 
         log_file.close()
 
+        # record the completed test in the manifest of the log dir, with
+        # the header as written into the log
+        header = dict([(key, "%s" %value) for (key, value) in kwargs.iteritems()])
+        header["test_start_time"] = "%s" %start_time
+        # the log prefix may contain directories
+        match = re.match("^i(\d+)_s(\d+)_r(\d+)$",
+                         os.path.basename(self.logprefix))
+        if match:
+            (iteration, scenario, run) = map(int, match.groups())
+        else:
+            (iteration, scenario, run) = (None, None, None)
+        if not isinstance(rc, (int, long)):
+            rc = "%s" %rc
+
+        appendManifest(self.args.log_dir, path = log_name,
+                       iteration = iteration, scenario = scenario, run = run,
+                       test = re.sub("^test_", "", test.func_name),
+                       header = header, rc = rc, start = start_time,
+                       end = time.time(), append = append)
+
     @defer.inlineCallbacks
     def tear_down(self):
         yield self._scf.disconnect()
@@ -20,11 +20,15 @@
 import sys
 import os.path
 import math
+import numpy
 from logging import info, debug, warn, error
 
 # tcp-eval imports
 from common.application import Application
+from analysis.testrecord import readHeader
 from analysis.testrecords_flowgrind import FlowgrindRecordFactory
+from analysis.intervalarchive import IntervalArchive
+from analysis.timeseries import isNumeric, resampleColumns, aggregateSeries, percentileOf
 from visualization.gnuplot import UmHistogram, UmGnuplot, UmLinePlot, UmStepPlot, UmBoxPlot
 
 class FlowPlotter(Application):
@@ -33,15 +37,20 @@ class FlowPlotter(Application):
 
         # object variables
         self.factory = FlowgrindRecordFactory()
+        self.archive = None
+        self.band = list()
+        # first column of the throughput band in the values file of a plot
+        self.bandcolumns = dict()
 
         # initialization of the option parser
         usage = "Usage: %prog [options] flowgrind-log[,flowgrind-log,..] [flowgrind-log[,flowgrind-log,..]] ...\n"\
                 "Creates graphs given by -G for every flowgrind-log specified.\n"\
-                "For a set of comma-seperated log files an average is built (throughput only!)"
+                "For a set of comma-seperated log files the statistic given by --statistic is built."
 
         self.parser.set_usage(usage)
         self.parser.set_defaults(outdir = "./", flownumber="0", resample='0', all = False, aname = "out",
-                                 plotsrc=True, plotdst=False, graphics='tput,cwnd,rtt,segments', startat=0, endat=0)
+                                 plotsrc=True, plotdst=False, graphics='tput,cwnd,rtt,segments', startat=0, endat=0,
+                                 archive = None, statistic = "mean", band = None)
 
         self.parser.add_option('-S', '--startat', metavar="time",
                         action = 'store', type = 'float', dest = 'startat',
@@ -79,6 +88,21 @@ class FlowPlotter(Application):
                         action = 'store', dest = 'graphics',
                         help = 'Graphics that will be plotted '\
                                 '[default: %default; optional: dupthresh]')
+        self.parser.add_option("-X", "--archive", metavar = "ArchiveDir",
+                        action = 'store', type = 'string', dest = 'archive',
+                        help = 'read the intervals of the given logs from an '\
+                               'archive written by flowgrind-export.py instead '\
+                               'of parsing the logs [default: parse the logs]')
+        self.parser.add_option("--statistic", metavar = "statistic",
+                        action = 'store', type = 'string', dest = 'statistic',
+                        help = 'statistic of the values of comma-seperated '\
+                               'log files: mean, median or pNN, e.g. p90 '\
+                               '[default: %default]')
+        self.parser.add_option("--band", metavar = "pLOW,pHIGH",
+                        action = 'store', type = 'string', dest = 'band',
+                        help = 'plot the throughput percentiles pLOW and '\
+                               'pHIGH of comma-seperated log files as a band, '\
+                               'e.g. p10,p90 [default: no band]')
         self.parser.add_option("-f", "--force",
                         action = "store_true", dest = "force",
                         help = "overwrite existing output")
@@ -103,9 +127,23 @@ class FlowPlotter(Application):
         else:
             self.graphics_array = ['tput','cwnd','rtt','segments']
 
-    def resample(self, record, directions, nosamples, flow):
+        if self.options.archive:
+            self.archive = IntervalArchive(self.options.archive)
+
+        if self.options.band:
+            self.band = self.options.band.split(',')
+            if len(self.band) != 2:
+                error("--band needs two percentiles, e.g. p10,p90")
+                sys.exit(1)
+        for statistic in [self.options.statistic] + self.band:
+            try:
+                percentileOf(statistic)
+            except ValueError, inst:
+                error(inst)
+                sys.exit(1)
+
+    def resample(self, sample, directions, nosamples, flow):
         # get sample rate for resampling
-        sample = float(record.results['reporting_interval'][0])
         resample = float(self.options.resample)
         rate = resample/sample
         debug("sample = %s, resample = %s -> rate = %s" %(sample, resample, rate))
@@ -116,77 +154,129 @@ class FlowPlotter(Application):
                 sys.exit(1)
 
             for d in directions:
-                for key in (flow[d].keys()):
-                    data = flow[d][key]
-
-                    # check if data is number
-                    try:
-                        float(data[0])
-                    except:
-                        continue
-                    debug("type: %s" %key)
-
-                    #actual resampling happens here
-                    next = 0    # where to store the next resample (at the end this is the number of points)
-                    all = 0     # where are we in the list?
-                    while all < nosamples:
-                        sum = 0         # sum of all parts
-                        r = rate        # how much to sum up
-
-                        if all != int(all):             # not an int
-                            frac = 1 - (all - int(all)) # get the fraction which has not yet been included
-                            sum += frac * data[int(all)]
-                            all += frac
-                            r -= frac
-
-                        while r >= 1:
-                            if all < nosamples:
-                                sum += data[int(all)]
-                                all += 1
-                                r -= 1
-                            else: break
-
-                        if r > 0 and all < nosamples:
-                            sum += r * data[int(all)]
-                            all += r
-                            r = 0
-
-                        out = sum/(rate-r)  # out is the value for the interval
-                                            # r is not 0, if we are at the end of the list
-                        data[next] = out
-                        next += 1
-
-                    #truncate table to new size
-                    del flow[d][key][next:nosamples]
+                # all number columns at once, integer columns get averaged
+                # as well
+                columns = dict([(key, flow[d][key][:nosamples])
+                                for key in flow[d].keys()
+                                if isNumeric(flow[d][key])
+                                and len(flow[d][key]) >= nosamples
+                                and key not in ('begin', 'end')])
+                for (key, values) in resampleColumns(columns, rate).iteritems():
+                    flow[d][key] = values
 
                 # set begin and end time
-                for i in range(next):
-                    flow[d]['begin'][i] = i*resample
-                    flow[d]['end'][i] = (i+1)*resample
+                size = int(math.ceil(nosamples / rate - 1e-9))
+                flow[d]['begin'] = numpy.arange(size) * resample
+                flow[d]['end'] = flow[d]['begin'] + resample
 
-            debug("new nosamples: %i" %next)
-            return next
+            debug("new nosamples: %i" %size)
+            return size
         else: return nosamples  # resample == 0
 
+    def aggregate_flows(self, flow_array):
+        """Builds the statistic of every number column of the flows in
+           flow_array over the files, aligned on a common time grid, and
+           saves it to the first flow. Returns the number of samples and the
+           throughput band of every direction."""
+
+        step = float(self.options.resample) or flow_array[0][4]
+        flow = flow_array[0][1]
+        bands = dict()
+        for d in ('S', 'D'):
+            series = list()
+            for (plotname, f, header, nosamples, sample) in flow_array:
+                series.append(dict([(key, f[d][key][:nosamples])
+                                    for key in f[d].keys()
+                                    if isNumeric(f[d][key])
+                                    and len(f[d][key]) >= nosamples]))
+            names = set.intersection(*[set(columns) for columns in series])
+            names = sorted(names - set(['begin', 'end']))
+
+            (begin, results) = aggregateSeries(series, step, names,
+                                               [self.options.statistic])
+            for name in names:
+                flow[d][name] = results[self.options.statistic][name]
+            flow[d]['begin'] = begin
+            flow[d]['end'] = begin + step
+
+            if self.band:
+                (begin, results) = aggregateSeries(series, step, ['tput'], self.band)
+                bands[d] = [results[statistic]['tput'] for statistic in self.band]
+
+        return (len(begin), bands)
+
+    def load_archive_flow(self, file, flownumber):
+        """Reads a flow of the given log from the interval archive. Without
+           resampling only the intervals between startat and endat are read.
+           Returns the flow, its reporting interval and the log header."""
+
+        keys = self.archive.keys(filename = file)
+        if not keys:
+            error("%s is not in the archive %s" %(file, self.options.archive))
+            sys.exit(1)
+
+        # flows are numbered like the flows of a record, in order of their ids
+        flow_ids = sorted(set([key[3] for key in keys]))
+        if flownumber >= len(flow_ids):
+            error("requested flow number %i greater then flows in file: %i"
+                    %(flownumber, len(flow_ids)))
+            sys.exit(1)
+
+        (start, end) = (None, None)
+        if not self.options.resample:
+            if self.options.startat > 0:
+                start = self.options.startat
+            if self.options.endat > 0:
+                # intervals beginning at endat are kept
+                end = numpy.nextafter(self.options.endat, numpy.inf)
+
+        flow = dict()
+        for key in keys:
+            if key[3] != flow_ids[flownumber]:
+                continue
+            chunk = key
+            # copy, the values are changed while resampling and averaging
+            columns = self.archive.read(key, start = start, end = end)
+            flow[key[4]] = dict([(column, numpy.array(values))
+                                 for (column, values) in columns.iteritems()])
+            flow[key[4]]['size'] = len(columns['begin'])
+
+        # reporting interval
+        sample = 0
+        interval = self.archive.read(chunk, ['begin', 'end'])
+        if len(interval['begin']):
+            sample = float(interval['end'][0] - interval['begin'][0])
+
+        try:
+            (header, offset) = readHeader(file)
+        except IOError:
+            header = dict()
+
+        return (flow, sample, header)
 
     def load_values(self, infile, flownumber):
 
         flow_array = []
 
         for file in infile.split(','):
-            # create record from given file
             debug("analyzing %s" %file)
-            record = self.factory.createRecord(file, "flowgrind")
-            flows = record.calculate("flows")
-            if not flows:
-                error("parse error")
-                sys.exit(1)
-
-            if flownumber > len(flows):
-                error("requested flow number %i greater then flows in file: %i"
-                        %(flownumber,len(flows) ) )
-                return
-            flow = flows[int(flownumber)]
+            if self.archive:
+                (flow, sample, header) = self.load_archive_flow(file, flownumber)
+            else:
+                # create record from given file
+                record = self.factory.createRecord(file, "flowgrind")
+                flows = record.calculate("flows")
+                if not flows:
+                    error("parse error")
+                    sys.exit(1)
+
+                if flownumber > len(flows):
+                    error("requested flow number %i greater then flows in file: %i"
+                            %(flownumber,len(flows) ) )
+                    return
+                flow = flows[int(flownumber)]
+                sample = record.calculate("reporting_interval")
+                header = record.getHeader()
 
             plotname = "%s_%d"%(os.path.splitext(os.path.basename(file))[0],flownumber)
 
@@ -196,51 +286,39 @@ class FlowPlotter(Application):
             debug("nosamples: %i" %nosamples)
 
             # resampling
-            nosamples = self.resample(record, directions, nosamples, flow)  # returns the new value for nosamples if anything was changed
+            nosamples = self.resample(sample, directions, nosamples, flow)  # returns the new value for nosamples if anything was changed
 
-            flow_array.append([plotname, flow, record, nosamples])
+            flow_array.append([plotname, flow, header, nosamples, sample])
 
-        #build average, save it to flow_array[0]
+        #build the statistic of all files, save it to flow_array[0]
+        bands = dict()
         if len(flow_array) > 1:
-            for i in range(len(flow_array[0][1]['S']['tput'])):
-                avg_S = 0
-                avg_D = 0
-                for l in range(len(flow_array)):
-                    avg_S += flow_array[l][1]['S']['tput'][i]
-                    avg_D += flow_array[l][1]['D']['tput'][i]
-                flow_array[0][1]['S']['tput'][i] = avg_S/len(flow_array)
-                flow_array[0][1]['D']['tput'][i] = avg_D/len(flow_array)
+            (nosamples, bands) = self.aggregate_flows(flow_array)
+        else:
+            nosamples = flow_array[0][3]
 
         plotname = flow_array[0][0] #just take one
-        flow = flow_array[0][1]        #average for all files
-        record = flow_array[0][2]      #hopefully the used parameter is always the same :)
-        nosamples = min([flow_array[i][3] for i in range(len(flow_array))])
+        flow = flow_array[0][1]        #statistic of all files
+        header = flow_array[0][2]      #hopefully the used parameter is always the same :)
 
-        #delete all data BEFORE some given time
+        #delete all data beginning before startat or after endat
+        begin = flow['D']['begin'][:nosamples]
+        first = 0
+        last = nosamples
         if self.options.startat > 0:
-            for i in range(nosamples):
-                if flow['D']['begin'][i] > self.options.startat: #get point where the time is over the threshold
-                    for d in directions:    #delete all entries before this point
-                        for key in flow[d].keys():
-                            try:
-                                len(flow[d][key])
-                            except: continue
-                            flow[d][key] = flow[d][key][i:nosamples]
-                    break
-            nosamples = nosamples-i
-
-        #delete all data AFTER some given time
+            first = numpy.searchsorted(begin, self.options.startat, "right")
         if self.options.endat > 0:
-            for i in range(nosamples):
-                if flow['D']['begin'][i] > self.options.endat: #get point where the time is over the threshold
-                    for d in directions:    #delete all entries before this point
-                        for key in flow[d].keys():
-                            try:
-                                len(flow[d][key])
-                            except: continue
-                            flow[d][key] = flow[d][key][0:i]
-                    break
-            nosamples = i
+            last = max(numpy.searchsorted(begin, self.options.endat, "right"), first)
+        if (first, last) != (0, nosamples):
+            for d in directions:
+                for key in flow[d].keys():
+                    try:
+                        len(flow[d][key])
+                    except: continue
+                    flow[d][key] = flow[d][key][first:last]
+                if d in bands:
+                    bands[d] = [band[first:last] for band in bands[d]]
+            nosamples = last - first
 
         # get max cwnd for ssth output
         cwnd_max = 0
@@ -249,7 +327,8 @@ class FlowPlotter(Application):
                 if flow[dir]['cwnd'][i] > cwnd_max:
                     cwnd_max = flow[dir]['cwnd'][i]
 
-        return plotname, flow, cwnd_max, record, nosamples
+        self.bands = bands
+        return plotname, flow, cwnd_max, header, nosamples
 
     def write_values(self, infile, flownumber):
         """Write values of one file"""
@@ -265,21 +344,28 @@ class FlowPlotter(Application):
             if rto == 3000: return 0
             else:           return rto
 
-        plotname, flow, cwnd_max, record, nosamples = self.load_values(infile, flownumber)
+        plotname, flow, cwnd_max, recordHeader, nosamples = self.load_values(infile, flownumber)
 
         outdir=self.options.outdir
         valfilename = os.path.join(outdir, plotname+".values")
         info("Generating %s..." % valfilename)
         fh = file(valfilename, "w")
         # header
-        recordHeader = record.getHeader()
         try:
             label = "%s %s Flow %d" %(recordHeader["scenario_label"],
                                       recordHeader["run_label"],
                                       flownumber)
         except:
             label = ""
-        fh.write("# start_time end_time forward_tput reverse_tput forward_cwnd reverse_cwnd ssth krtt krto lost reor retr tret dupthresh\n")
+        columns = "start_time end_time forward_tput reverse_tput forward_cwnd reverse_cwnd ssth krtt krto lost reor retr tret"
+        if 'dupthresh' in self.graphics_array:
+            columns += " dupthresh"
+        if self.bands:
+            # gnuplot columns count from 1
+            self.bandcolumns[plotname] = len(columns.split()) + 1
+            columns += " forward_tput_%s forward_tput_%s reverse_tput_%s reverse_tput_%s" \
+                    %tuple(self.band + self.band)
+        fh.write("# %s\n" % columns)
         for i in range(nosamples):
             formatfields = (flow['S']['begin'][i],
                             flow['S']['end'][i],
@@ -298,6 +384,10 @@ class FlowPlotter(Application):
             if 'dupthresh' in self.graphics_array:
                 formatfields += tuple([flow['S']['dupthresh'][i]])
                 formatstring += " %f"
+            if self.bands:
+                formatfields += tuple([band[i] for d in ('S', 'D')
+                                       for band in self.bands[d]])
+                formatstring += " %f %f %f %f"
             formatstring += "\n"
             fh.write( formatstring % formatfields )
         fh.close()
@@ -331,6 +421,19 @@ class FlowPlotter(Application):
                     p.plot(valfilename, "%s" %label, using="2:3", linestyle=count+1)
                 elif self.options.plotdst and not self.options.plotsrc:
                     p.plot(valfilename, "%s" %label, using="2:4", linestyle=count+1)
+
+                # throughput band of the files of the plot
+                band = self.bandcolumns.get(plotname)
+                if band:
+                    title = "%s-%s %s" %(self.band[0], self.band[1], label)
+                    styles = [(self.options.plotsrc, band, 2*count),
+                              (self.options.plotdst, band + 2, 2*count+1)]
+                    if not (self.options.plotsrc and self.options.plotdst):
+                        styles = [(plot, column, count+1) for (plot, column, style) in styles]
+                    for (plot, column, style) in styles:
+                        if plot:
+                            p.plot(valfilename, title, using="2:%u" %column, linestyle=style)
+                            p.plot(valfilename, "", using="2:%u" %(column + 1), linestyle=style)
             # output plot
             p.save()
 